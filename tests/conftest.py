@@ -0,0 +1,4 @@
+import os, sys
+
+# the modules are plain scripts at the top of the repository rather than a package, so make them importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,83 @@
+import json
+from wikipedia_pageview_aggregates import PageviewAggregates
+from wikipedia_pageview_analysis import months_by_article
+from wikipedia_pageview_store import jsonl_to_store, load_store
+from wikipedia_pageview_writer import read_records
+
+#writes one record per title whose mobile and desktop series both have the given views, one month each from 2022-01
+#titles in failed are written marked failed, like the generator does for titles with a failed request
+def write_jsonl(path, views_by_title, mode = "w", failed = ()):
+    with open(path, mode) as jsonl_file:
+        for title, views in views_by_title.items():
+            series = [{"timestamp": "2022%02d0100" % (month + 1), "views": v} for month, v in enumerate(views)]
+            record = {"title": title, "mobile": series, "desktop": series}
+            if title in failed:
+                record["failed"] = True
+            jsonl_file.write(json.dumps(record) + "\n")
+
+def test_ties_follow_the_titles_not_the_file_order(tmp_path):
+    path = tmp_path / "stream.jsonl"
+    write_jsonl(path, {"Tuebingosaurus": [], "Elemgasem": [], "Aardonyx": [5]})
+    aggregates = PageviewAggregates(":memory:")
+    aggregates.update_from_jsonl(path, ["mobile", "desktop"], ["Elemgasem", "Tuebingosaurus", "Aardonyx"])
+    assert aggregates.bottom_k("desktop", "months", 2) == ["Elemgasem", "Tuebingosaurus"]
+
+def test_updating_with_fewer_titles_drops_the_others(tmp_path):
+    path = tmp_path / "stream.jsonl"
+    write_jsonl(path, {"A": [1], "B": [2], "C": [3]})
+    aggregates = PageviewAggregates(":memory:")
+    aggregates.update_from_jsonl(path, ["mobile", "desktop"], ["A", "B", "C"])
+    assert aggregates.matches("mobile", {"A": (1, "2022010100"), "B": (1, "2022010100"), "C": (1, "2022010100")})
+    aggregates.update_from_jsonl(path, ["mobile", "desktop"], ["A", "C"])
+    assert aggregates.matches("mobile", {"A": (1, "2022010100"), "C": (1, "2022010100")})
+    assert not aggregates.matches("mobile", {"A": (1, "2022010100"), "B": (1, "2022010100"), "C": (1, "2022010100")})
+    assert aggregates.top_k("mobile", "peak", 3) == ["C", "A"]
+
+def test_update_only_reads_records_written_since_the_last_one(tmp_path):
+    path = tmp_path / "stream.jsonl"
+    write_jsonl(path, {"A": [1, 2], "B": [3, 4]})
+    aggregates = PageviewAggregates(":memory:")
+    assert aggregates.update_from_jsonl(path, ["mobile"], ["A", "B"]) == 4
+    write_jsonl(path, {"A": [1, 2, 7]}, mode="a")
+    #only A's new record is parsed, its refreshed last month and the new one
+    assert aggregates.update_from_jsonl(path, ["mobile"], ["A", "B"]) == 2
+    assert aggregates.get("mobile", "A")["total"] == 10
+    assert aggregates.update_from_jsonl(path, ["mobile"], ["A", "B"]) == 0
+
+def test_a_restarted_file_is_read_again_from_the_start(tmp_path):
+    path = tmp_path / "stream.jsonl"
+    write_jsonl(path, {"A": [1], "B": [2]})
+    aggregates = PageviewAggregates(":memory:")
+    aggregates.update_from_jsonl(path, ["mobile"], ["A", "B"])
+    write_jsonl(path, {"B": [2, 6], "A": [1, 3], "C": [9]})
+    aggregates.update_from_jsonl(path, ["mobile"], ["A", "B", "C"])
+    assert [aggregates.get("mobile", title)["total"] for title in ["A", "B", "C"]] == [4, 8, 9]
+
+def test_titles_skipped_by_an_earlier_update_are_read_again(tmp_path):
+    path = tmp_path / "stream.jsonl"
+    write_jsonl(path, {"A": [1], "B": [2]})
+    aggregates = PageviewAggregates(":memory:")
+    aggregates.update_from_jsonl(path, ["mobile"], ["A"])
+    aggregates.update_from_jsonl(path, ["mobile"], ["A", "B"])
+    assert aggregates.get("mobile", "B")["total"] == 2
+
+def test_an_index_out_of_date_with_failed_titles_does_not_match_the_loaded_data(tmp_path):
+    path = tmp_path / "stream.jsonl"
+    write_jsonl(path, {"A": [100, 100], "B": [10, 10]})
+    aggregates = PageviewAggregates(":memory:")
+    aggregates.update_from_jsonl(path, ["mobile", "desktop"], ["A", "B"])
+    #the next run is started again and A's requests fail, so the outputs hold nothing for it
+    write_jsonl(path, {"A": [], "B": [10, 10, 10]}, failed={"A"})
+    aggregates.update_from_jsonl(path, ["mobile", "desktop"], ["A", "B"])
+    assert aggregates.get("desktop", "A")["total"] == 200
+    assert aggregates.top_k("desktop", "average", 1) == ["A"]
+    loaded = {title: record["desktop"] for title, record in read_records(str(path))}
+    assert not aggregates.matches("desktop", months_by_article(loaded))
+    jsonl_to_store(str(path), "desktop", str(tmp_path / "desktop"), titles=["A", "B"])
+    assert months_by_article(load_store(str(tmp_path / "desktop"))) == {"A": (0, None), "B": (3, "2022030100")}
+    assert not aggregates.matches("desktop", months_by_article(load_store(str(tmp_path / "desktop"))))
+    #once A is written in full the index and the data agree again
+    write_jsonl(path, {"A": [100, 100, 100]}, mode="a")
+    aggregates.update_from_jsonl(path, ["mobile", "desktop"], ["A", "B"])
+    loaded = {title: record["desktop"] for title, record in read_records(str(path))}
+    assert aggregates.matches("desktop", months_by_article(loaded))
@@ -0,0 +1,24 @@
+import pytest
+from wikipedia_pageview_benchmark import config_differences, find_regressions
+
+CONFIG = {"sizes": [1000], "latency": 0.0, "error_rate": 0.0, "rate_limited_rate": 0.0, "missing_rate": 0.001,
+          "max_workers": 32, "rate_limit": 5000.0}
+
+def results(requests_per_second, **config):
+    return {"config": dict(CONFIG, **config), "results": [{"articles": 1000, "requests_per_second": requests_per_second,
+                                                           "generator_seconds": 1.0, "analysis_seconds": 1.0, "peak_rss_mb": 100.0}]}
+
+def test_regressions_are_found_when_the_settings_match():
+    assert find_regressions(results(1000.0), results(1000.0)) == []
+    assert len(find_regressions(results(500.0), results(1000.0))) == 1
+
+def test_different_sizes_are_not_a_config_mismatch():
+    assert config_differences(results(1000.0, sizes=[1000, 10000]), results(1000.0)) == []
+
+def test_results_run_with_other_settings_are_refused():
+    with pytest.raises(ValueError, match="latency"):
+        find_regressions(results(500.0, latency=0.05), results(1000.0))
+    assert config_differences(results(500.0, latency=0.05), results(1000.0)) == ["latency is 0.05 but was 0.0"]
+
+def test_other_settings_can_be_compared_anyway():
+    assert len(find_regressions(results(500.0, max_workers=8), results(1000.0), allow_config_mismatch=True)) == 1
@@ -0,0 +1,56 @@
+from wikipedia_pageview_cache import PageviewCache
+from wikipedia_pageview_simulator import _period_timestamps
+
+KEY = ("en.wikipedia.org", "desktop", "user", "Stegosaurus", "monthly")
+
+#a request_fn that answers like the API with one item per month, and remembers the ranges it was asked for
+def make_request_fn(calls):
+    def request_fn(start, end):
+        calls.append((start, end))
+        return {"items": [{"timestamp": timestamp, "views": int(timestamp[:6])} for timestamp in _period_timestamps("monthly", start, end)]}
+    return request_fn
+
+def timestamps(response):
+    return [month["timestamp"] for month in response["items"]]
+
+def test_repeated_request_is_a_hit():
+    cache = PageviewCache(":memory:")
+    calls = []
+    first = cache.fetch(KEY, "2015070100", "2018010100", make_request_fn(calls))
+    second = cache.fetch(KEY, "2015070100", "2018010100", make_request_fn(calls))
+    assert first == second
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_tail_refresh_only_requests_from_the_cached_end():
+    cache = PageviewCache(":memory:")
+    calls = []
+    cache.fetch(KEY, "2015070100", "2018010100", make_request_fn(calls))
+    response = cache.fetch(KEY, "2015070100", "2020010100", make_request_fn(calls))
+    assert calls[1] == ("2018010100", "2020010100")
+    assert timestamps(response) == _period_timestamps("monthly", "2015070100", "2020010100")
+    assert cache.tail_refreshes == 1
+
+def test_later_disjoint_range_does_not_leave_a_gap():
+    cache = PageviewCache(":memory:")
+    calls = []
+    cache.fetch(KEY, "2015070100", "2018010100", make_request_fn(calls))
+    later = cache.fetch(KEY, "2020010100", "2022010100", make_request_fn(calls))
+    assert timestamps(later) == _period_timestamps("monthly", "2020010100", "2022010100")
+    full = cache.fetch(KEY, "2015070100", "2022010100", make_request_fn(calls))
+    assert timestamps(full) == _period_timestamps("monthly", "2015070100", "2022010100")
+    assert cache.coverage(KEY) == ("2015070100", "2022010100")
+
+def test_earlier_disjoint_range_does_not_leave_a_gap():
+    cache = PageviewCache(":memory:")
+    calls = []
+    cache.fetch(KEY, "2020010100", "2022010100", make_request_fn(calls))
+    earlier = cache.fetch(KEY, "2015070100", "2017010100", make_request_fn(calls))
+    assert timestamps(earlier) == _period_timestamps("monthly", "2015070100", "2017010100")
+    full = cache.fetch(KEY, "2015070100", "2022010100", make_request_fn(calls))
+    assert timestamps(full) == _period_timestamps("monthly", "2015070100", "2022010100")
+
+def test_failed_request_is_not_cached():
+    cache = PageviewCache(":memory:")
+    assert cache.fetch(KEY, "2015070100", "2018010100", lambda start, end: None) is None
+    assert cache.coverage(KEY) is None
@@ -0,0 +1,80 @@
+import pytest
+import wikipedia_pageview_client
+from wikipedia_pageview_simulator import PageviewSimulator, synthetic_titles
+from wikipedia_pageview_telemetry import PageviewTelemetry
+from wikipedia_pageview_timeseries_generator import END_DATE, START_DATE, make_client
+
+TITLES = synthetic_titles(20)
+
+#records the backoff sleeps instead of sleeping, so retries cost no time. The clients below have no rate limiter, so
+#every sleep recorded is a backoff
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(wikipedia_pageview_client.time, "sleep", slept.append)
+    return slept
+
+#requests every title once and returns the responses, the client's counters and the telemetry's attempt outcomes
+def request_all(simulator, max_retries):
+    telemetry = PageviewTelemetry()
+    client = make_client(4, 1000, simulator.url, telemetry)
+    client.rate_limiter = None
+    client.max_retries = max_retries
+    try:
+        responses = [client.request_pageviews(title, "desktop", START_DATE, END_DATE) for title in TITLES]
+        return responses, client.stats(), telemetry.outcomes
+    finally:
+        client.close()
+
+def test_rate_limited_requests_wait_for_retry_after_and_are_counted(sleeps):
+    with PageviewSimulator(rate_limited_rate=0.5, retry_after=2) as simulator:
+        responses, stats, outcomes = request_all(simulator, max_retries=20)
+    assert all("items" in response for response in responses)
+    assert stats["requests"] == simulator.requests
+    assert stats["retries"] == simulator.requests - len(TITLES) > 0
+    assert stats["failures"] == 0
+    assert outcomes == {"ok": len(TITLES), "http_429": stats["retries"]}
+    assert len(sleeps) == stats["retries"]
+    assert all(seconds >= 2 for seconds in sleeps)
+
+def test_server_errors_are_retried_and_counted(sleeps):
+    with PageviewSimulator(error_rate=0.5) as simulator:
+        responses, stats, outcomes = request_all(simulator, max_retries=20)
+    assert all("items" in response for response in responses)
+    assert stats["retries"] == simulator.requests - len(TITLES) > 0
+    assert stats["failures"] == 0
+    assert outcomes == {"ok": len(TITLES), "http_500": stats["retries"]}
+    assert len(sleeps) == stats["retries"]
+
+def test_client_gives_up_after_max_retries(sleeps, capsys):
+    with PageviewSimulator(error_rate=1.0) as simulator:
+        client = make_client(4, 1000, simulator.url)
+        client.rate_limiter = None
+        client.max_retries = 3
+        try:
+            assert client.request_pageviews("Tyrannosaurus", "desktop", START_DATE, END_DATE) is None
+            stats = client.stats()
+        finally:
+            client.close()
+    assert simulator.requests == 4
+    assert (stats["requests"], stats["retries"], stats["failures"]) == (4, 3, 1)
+    assert len(sleeps) == 3
+    assert "giving up after 4 tries" in capsys.readouterr().out
+
+def test_not_found_is_not_retried(sleeps):
+    with PageviewSimulator() as simulator:
+        client = make_client(4, 1000, simulator.url)
+        client.rate_limiter = None
+        try:
+            response = client.request_pageviews("Tuebingosaurus", "desktop", START_DATE, END_DATE)
+            stats = client.stats()
+        finally:
+            client.close()
+    assert wikipedia_pageview_client.is_not_found_response(response)
+    assert simulator.requests == stats["requests"] == 1
+    assert sleeps == []
+
+def test_backoff_is_jittered_below_a_capped_exponential():
+    for attempt in range(20):
+        limit = min(wikipedia_pageview_client.BACKOFF_MAX, wikipedia_pageview_client.BACKOFF_BASE * 2 ** attempt)
+        assert all(0.0 <= wikipedia_pageview_client.backoff_seconds(attempt) <= limit for _ in range(50))
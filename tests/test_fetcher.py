@@ -0,0 +1,48 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wikipedia_pageview_fetcher import TokenBucketRateLimiter, fetch_concurrently, iter_concurrently
+from wikipedia_pageview_simulator import PageviewSimulator, synthetic_titles
+from wikipedia_pageview_timeseries_generator import make_client, request_pageviews_concurrently
+
+def test_rate_cap_holds_across_workers():
+    rate = 100.0
+    start = time.monotonic()
+    limiter = TokenBucketRateLimiter(rate)
+    def acquire(_):
+        limiter.acquire()
+        return time.monotonic()
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        granted = sorted(executor.map(acquire, range(50)))
+    #the bucket holds one token, so the n-th request can't go out before n / rate seconds however many threads ask at once
+    for n, granted_at in enumerate(granted):
+        assert granted_at - start >= n / rate - 0.001
+
+def test_rate_cap_holds_against_the_simulator():
+    titles = synthetic_titles(10)
+    with PageviewSimulator() as simulator:
+        client = make_client(8, 50, simulator.url)
+        try:
+            start = time.monotonic()
+            responses = request_pageviews_concurrently(titles, ["desktop", "mobile-web", "mobile-app"], max_workers=8, client=client)
+            elapsed = time.monotonic() - start
+        finally:
+            client.close()
+    assert simulator.requests == len(responses) == 30
+    assert elapsed >= 29 / 50 - 0.01
+
+def test_concurrent_output_matches_serial():
+    titles = synthetic_titles(12) + ["Tuebingosaurus"]
+    accesses = ["desktop", "mobile-web", "mobile-app"]
+    with PageviewSimulator(latency_jitter=0.005) as simulator:
+        serial = request_pageviews_concurrently(titles, accesses, max_workers=1, rate_limit=1000, endpoint_url=simulator.url)
+        concurrent = request_pageviews_concurrently(titles, accesses, max_workers=8, rate_limit=1000, endpoint_url=simulator.url)
+    assert list(concurrent) == list(serial) == [(title, access) for title in titles for access in accesses]
+    assert concurrent == serial
+
+def test_every_key_is_yielded_once_and_fetch_keeps_key_order():
+    keys = list(range(100))
+    def request_fn(key):
+        time.sleep((key % 7) / 1000)
+        return key * 2
+    assert sorted(key for key, _ in iter_concurrently(keys, request_fn, 8)) == keys
+    assert list(fetch_concurrently(keys, request_fn, 8).items()) == [(key, key * 2) for key in keys]
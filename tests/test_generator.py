@@ -0,0 +1,22 @@
+import contextlib, io
+import pytest
+import wikipedia_pageview_timeseries_generator as generator
+from wikipedia_pageview_simulator import PageviewSimulator, synthetic_titles
+
+TITLES = synthetic_titles(6)
+
+@pytest.mark.parametrize("max_workers", [1, 24])
+def test_max_workers_flag_reaches_the_thread_pool(tmp_path, monkeypatch, max_workers):
+    pool_sizes = []
+    iter_concurrently = generator.iter_concurrently
+    def recording_iter_concurrently(keys, request_fn, max_workers = 8):
+        pool_sizes.append(max_workers)
+        return iter_concurrently(keys, request_fn, max_workers)
+    monkeypatch.setattr(generator, "iter_concurrently", recording_iter_concurrently)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "titles.csv").write_text("name,url\n" + "".join(title + ",\n" for title in TITLES))
+    with PageviewSimulator() as simulator, contextlib.redirect_stdout(io.StringIO()):
+        generator.main(["--titles-csv", "titles.csv", "--endpoint-url", simulator.url, "--rate-limit", "1000",
+                        "--max-workers", str(max_workers), "--cache", "", "--metrics", "", "--aggregates", ""])
+    assert pool_sizes == [max_workers]
+    assert simulator.requests == len(TITLES) * 4
@@ -0,0 +1,50 @@
+import contextlib, io
+from wikipedia_pageview_jobs import PageviewJob, count_requests, run_jobs
+from wikipedia_pageview_simulator import PageviewSimulator, synthetic_titles
+from wikipedia_pageview_timeseries_generator import make_client, stream_monthly_pageviews
+from wikipedia_pageview_writer import read_records
+
+TITLES = synthetic_titles(6)
+ALL_OUTPUTS = ["mobile", "desktop", "cumulative"]
+
+#the jobs overlap in titles and dates. The monthly ones start mid month, the daily ones at both ends of a month
+def make_jobs(tmp_path):
+    return [PageviewJob("early", TITLES[2:6], "en.wikipedia.org", ALL_OUTPUTS, "2018061500", "2019120100", "monthly",
+                        str(tmp_path / "early.jsonl"), False),
+            PageviewJob("late", TITLES[0:4], "en.wikipedia.org", ALL_OUTPUTS, "2019010100", "2020070100", "monthly",
+                        str(tmp_path / "late.jsonl"), False),
+            PageviewJob("january", TITLES[0:2], "en.wikipedia.org", ["desktop"], "2020010100", "2020013100", "daily",
+                        str(tmp_path / "january.jsonl"), False),
+            PageviewJob("february", TITLES[1:3], "en.wikipedia.org", ["desktop"], "2020011500", "2020021000", "daily",
+                        str(tmp_path / "february.jsonl"), False)]
+
+def run(simulator, function, *args, **kwargs):
+    client = make_client(4, 1000, simulator.url)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            function(*args, client=client, **kwargs)
+    finally:
+        client.close()
+
+def test_shared_requests_are_sent_once_and_every_job_gets_its_own_range(tmp_path):
+    jobs = make_jobs(tmp_path)
+    with PageviewSimulator() as simulator:
+        run(simulator, run_jobs, jobs, max_workers=4)
+        jobs_requests = simulator.requests
+        for job in jobs:
+            direct_path = str(tmp_path / ("direct_" + job.name + ".jsonl"))
+            run(simulator, stream_monthly_pageviews, direct_path, job.titles, job.outputs, job.start, job.end,
+                max_workers=4, resume=False, granularity=job.granularity)
+            assert dict(read_records(job.output_path)) == dict(read_records(direct_path)), job.name
+    #six titles with four access types each monthly, and three titles with one access type daily
+    assert jobs_requests == count_requests(jobs)[1] == 6 * 4 + 3
+    assert simulator.requests - jobs_requests == count_requests(jobs)[0] == 4 * 4 * 2 + 2 * 2
+
+def test_monthly_jobs_leave_out_the_end_month_and_daily_jobs_keep_both_ends(tmp_path):
+    jobs = make_jobs(tmp_path)
+    with PageviewSimulator() as simulator:
+        run(simulator, run_jobs, jobs, max_workers=4)
+    early = dict(read_records(jobs[0].output_path))[TITLES[3]]["desktop"]
+    assert (early[0]["timestamp"], early[-1]["timestamp"]) == ("2018060100", "2019110100")
+    february = dict(read_records(jobs[3].output_path))[TITLES[1]]["desktop"]
+    assert (february[0]["timestamp"], february[-1]["timestamp"]) == ("2020011500", "2020021000")
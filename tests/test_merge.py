@@ -0,0 +1,66 @@
+import contextlib, io, json
+from wikipedia_pageview_simulator import NOT_FOUND_BODY, PageviewSimulator, synthetic_titles
+from wikipedia_pageview_timeseries_generator import (MergeReport, derive_mobile_pageviews, generate_monthly_pageviews,
+                                                     merge_series_by_timestamp)
+
+NOT_FOUND = json.loads(NOT_FOUND_BODY)
+
+#a list of monthly items of access in 2022, one for each month in views_by_month
+def series(access, views_by_month):
+    return [{"timestamp": "2022%02d0100" % month, "views": views, "access": access} for month, views in sorted(views_by_month.items())]
+
+def views(items):
+    return {int(month["timestamp"][4:6]): month["views"] for month in items}
+
+def test_series_starting_in_different_months_are_merged_by_timestamp():
+    merged, report = merge_series_by_timestamp(series("mobile-app", {1: 1, 2: 2, 3: 3}), series("mobile-web", {3: 30, 4: 40}))
+    assert views(merged) == {1: 1, 2: 2, 3: 33, 4: 40}
+    assert [month["timestamp"] for month in merged] == sorted(month["timestamp"] for month in merged)
+    assert report == MergeReport(months=4, left_only=2, right_only=1)
+
+def test_gaps_in_the_middle_keep_the_months_either_series_has():
+    merged, report = merge_series_by_timestamp(series("mobile-app", {1: 1, 2: 2, 5: 5, 6: 6}), series("mobile-web", {1: 10, 3: 30, 6: 60}))
+    assert views(merged) == {1: 11, 2: 2, 3: 30, 5: 5, 6: 66}
+    assert report == MergeReport(months=5, left_only=2, right_only=1)
+
+def test_series_that_line_up_report_no_months_on_one_side_only():
+    _, report = merge_series_by_timestamp(series("mobile-app", {1: 1, 2: 2}), series("mobile-web", {1: 1, 2: 2}))
+    assert report == MergeReport(months=2, left_only=0, right_only=0)
+
+def test_merging_labels_items_and_leaves_its_inputs_alone():
+    left, right = series("mobile-app", {1: 1}), series("mobile-web", {1: 10, 2: 20})
+    merged, _ = merge_series_by_timestamp(left, right, "mobile-app")
+    assert all(month["access"] == "mobile-app" for month in merged)
+    assert left == series("mobile-app", {1: 1}) and right == series("mobile-web", {1: 10, 2: 20})
+
+def test_one_side_empty_or_not_found_keeps_the_other():
+    app = series("mobile-app", {1: 1, 2: 2})
+    merged, report = merge_series_by_timestamp(app, [])
+    assert views(merged) == {1: 1, 2: 2}
+    assert report == MergeReport(months=2, left_only=2, right_only=0)
+    responses = {("A", "mobile-app"): {"items": app}, ("A", "mobile-web"): NOT_FOUND,
+                 ("B", "mobile-app"): NOT_FOUND, ("B", "mobile-web"): {"items": series("mobile-web", {3: 30})},
+                 ("C", "mobile-app"): NOT_FOUND, ("C", "mobile-web"): NOT_FOUND,
+                 ("D", "mobile-app"): {"items": app}, ("D", "mobile-web"): None}
+    reports = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        mobile = derive_mobile_pageviews(responses, ["A", "B", "C", "D"], reports)
+    assert views(mobile["A"]) == {1: 1, 2: 2}
+    assert views(mobile["B"]) == {3: 30}
+    assert mobile["B"][0]["access"] == "mobile-app"
+    #no data at all, or a failed request so the total can't be known
+    assert mobile["C"] == {} and mobile["D"] == {}
+    assert reports["A"] == MergeReport(months=2, left_only=2, right_only=0)
+    assert reports["B"] == MergeReport(months=1, left_only=0, right_only=1)
+
+def test_derived_all_access_matches_the_all_access_response():
+    titles = synthetic_titles(10)
+    with PageviewSimulator() as simulator, contextlib.redirect_stdout(io.StringIO()):
+        derived = generate_monthly_pageviews(titles, ["cumulative"], derive_all_access=True, max_workers=4, rate_limit=1000,
+                                             endpoint_url=simulator.url)["cumulative"]
+        requested = generate_monthly_pageviews(titles, ["cumulative"], derive_all_access=False, max_workers=4, rate_limit=1000,
+                                               endpoint_url=simulator.url)["cumulative"]
+    assert all(requested[title] for title in titles)
+    for title in titles:
+        assert [(month["timestamp"], month["views"]) for month in derived[title]] == \
+            [(month["timestamp"], month["views"]) for month in requested[title]]
@@ -0,0 +1,68 @@
+import contextlib, io, json
+from wikipedia_pageview_simulator import PageviewSimulator, synthetic_titles
+from wikipedia_pageview_timeseries_generator import make_client, stream_monthly_pageviews
+from wikipedia_pageview_writer import completed_titles, read_records
+
+TITLES = synthetic_titles(5)
+
+def stream(simulator, path, resume, max_retries = 0, forbidden = ()):
+    client = make_client(4, 1000, simulator.url)
+    client.max_retries = max_retries
+    request_pageviews = client.request_pageviews
+    #titles in forbidden get an error body back, like a 403, which is not retried
+    def request_or_forbid(article_title, *args):
+        if article_title in forbidden:
+            return {"type": "https://mediawiki.org/wiki/HyperSwitch/errors/forbidden", "title": "Forbidden"}
+        return request_pageviews(article_title, *args)
+    client.request_pageviews = request_or_forbid
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            written = stream_monthly_pageviews(str(path), TITLES, client=client, resume=resume)
+        return written, client.stats()["requests"]
+    finally:
+        client.close()
+
+def test_failed_titles_are_requested_again_on_resume(tmp_path):
+    path = tmp_path / "stream.jsonl"
+    with PageviewSimulator(error_rate=1.0) as simulator:
+        written, _ = stream(simulator, path, resume=False)
+        assert written == len(TITLES)
+        assert completed_titles(str(path)) == set()
+        simulator.error_rate = 0.0
+        written, requests = stream(simulator, path, resume=True)
+    assert written == len(TITLES)
+    assert requests == len(TITLES) * 4
+    assert completed_titles(str(path)) == set(TITLES)
+    #the records written on the second run are the ones that count
+    records = dict(read_records(str(path)))
+    assert all(records[title]["desktop"] for title in TITLES)
+
+def test_titles_answered_with_an_error_are_requested_again_on_resume(tmp_path):
+    path = tmp_path / "stream.jsonl"
+    with PageviewSimulator() as simulator:
+        written, _ = stream(simulator, path, resume=False, forbidden={TITLES[0]})
+        assert written == len(TITLES)
+        assert completed_titles(str(path)) == set(TITLES[1:])
+        written, requests = stream(simulator, path, resume=True)
+    assert (written, requests) == (1, 4)
+    assert completed_titles(str(path)) == set(TITLES)
+
+def test_titles_not_found_are_completed(tmp_path):
+    path = tmp_path / "stream.jsonl"
+    with PageviewSimulator(missing_titles=[TITLES[0]]) as simulator:
+        stream(simulator, path, resume=False)
+    assert completed_titles(str(path)) == set(TITLES)
+
+def test_completed_titles_are_not_requested_again(tmp_path):
+    path = tmp_path / "stream.jsonl"
+    with PageviewSimulator() as simulator:
+        stream(simulator, path, resume=False)
+        written, requests = stream(simulator, path, resume=True)
+    assert (written, requests) == (0, 0)
+
+def test_partly_written_last_line_is_cut_off(tmp_path):
+    path = tmp_path / "stream.jsonl"
+    path.write_text(json.dumps({"title": "A", "desktop": []}) + "\n" + '{"title": "B", "desk')
+    assert completed_titles(str(path)) == {"A"}
+    assert path.read_text().count("\n") == 1
+    assert list(read_records(str(path))) == [("A", {"desktop": []})]
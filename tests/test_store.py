@@ -0,0 +1,59 @@
+import json
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from wikipedia_pageview_store import jsonl_to_store, load_store, resample_matrix, PageviewMatrix
+
+def write_jsonl(path, records):
+    with open(path, "w") as jsonl_file:
+        for title, series in records:
+            jsonl_file.write(json.dumps({"title": title, "desktop": series}) + "\n")
+
+def test_store_rows_follow_titles_not_file_order(tmp_path):
+    path = str(tmp_path / "stream.jsonl")
+    write_jsonl(path, [("C", [{"timestamp": "2020010100", "views": 3}]), ("A", []),
+                       ("B", [{"timestamp": "2020020100", "views": 2}])])
+    assert jsonl_to_store(path, "desktop", str(tmp_path / "store"), titles=["A", "B", "C", "D"]) == 3
+    matrix = load_store(str(tmp_path / "store"))
+    assert matrix.articles == ["A", "B", "C"]
+    assert matrix.timestamps == ["2020010100", "2020020100"]
+    assert matrix["A"] == []
+    assert matrix["B"] == [{"timestamp": "2020020100", "views": 2}]
+    assert matrix["C"] == [{"timestamp": "2020010100", "views": 3}]
+
+def test_store_rows_default_to_file_order(tmp_path):
+    path = str(tmp_path / "stream.jsonl")
+    write_jsonl(path, [("C", []), ("A", [])])
+    jsonl_to_store(path, "desktop", str(tmp_path / "store"))
+    assert load_store(str(tmp_path / "store")).articles == ["C", "A"]
+
+#a one article matrix of daily data from start to end, both included, with day n of the range getting n views
+def daily_matrix(start, end):
+    day, last = datetime.strptime(start, "%Y%m%d"), datetime.strptime(end, "%Y%m%d")
+    timestamps = []
+    while day <= last:
+        timestamps.append(day.strftime("%Y%m%d00"))
+        day += timedelta(days=1)
+    views = np.arange(len(timestamps), dtype=np.int64)[None, :]
+    return PageviewMatrix(["A"], timestamps, views, np.ones(views.shape, dtype=bool), "daily")
+
+def test_daily_to_monthly_sums_whole_months_and_drops_the_partial_last_one():
+    monthly = resample_matrix(daily_matrix("20220801", "20221001"), "monthly")
+    assert monthly.timestamps == ["2022080100", "2022090100"]
+    assert monthly["A"] == [{"timestamp": "2022080100", "views": sum(range(31))},
+                            {"timestamp": "2022090100", "views": sum(range(31, 61))}]
+
+def test_partial_periods_can_be_kept():
+    monthly = resample_matrix(daily_matrix("20220801", "20221001"), "monthly", drop_partial=False)
+    assert monthly.timestamps == ["2022080100", "2022090100", "2022100100"]
+
+def test_daily_to_weekly_drops_partial_weeks_at_both_ends():
+    #2022-08-03 is a Wednesday and 2022-08-31 is a Wednesday, so only the three weeks from Monday 2022-08-08 are whole
+    weekly = resample_matrix(daily_matrix("20220803", "20220831"), "weekly")
+    assert weekly.timestamps == ["2022080800", "2022081500", "2022082200"]
+    assert weekly["A"][0]["views"] == sum(range(5, 12))
+
+def test_weekly_data_cannot_be_resampled_to_months():
+    weekly = resample_matrix(daily_matrix("20220801", "20220904"), "weekly")
+    with pytest.raises(ValueError):
+        resample_matrix(weekly, "monthly")
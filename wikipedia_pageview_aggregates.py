@@ -0,0 +1,237 @@
+'''this file contains the aggregate index the analysis stage can pick its chart articles from
+
+The charts only need a few numbers per article and access type: the average views per month, the peak month and the
+number of months with data. Rather than working them out again from every article's whole history on every run, they
+are kept in a SQLite file next to the running totals they come from:
+    total        the sum of views over every month seen
+    months       the number of months seen
+    peak         the highest views in a single month, -1 if there are none
+    average      total / months, -1 if there are no months, stored so it can be indexed
+    first_month  the timestamp of the first month seen
+    last_month   the timestamp of the last month seen, and last_views its views
+Each metric has an index in both directions, so "highest average", "top 10 peak" and "fewest months" are answered by
+reading the first k entries of an index instead of going over every article. Equal values come back in the order of the
+titles the index was last updated with (or the order the articles were first added if no titles were given), like
+wikipedia_pageview_metrics.top_k and bottom_k. Updating with titles also drops the articles that are not in them, so the
+index holds the same articles as the generator's outputs; matches tells whether it still agrees with a dataset.
+
+Months are only ever added after last_month. When an article's series is passed in again with new months on the end,
+the months up to last_month are skipped with a binary search, so an update costs time in proportion to the new months
+and not the whole history. last_month itself is taken again in case it was still incomplete when it was first seen,
+the same way PageviewCache refreshes the last cached month. Because of that a peak can only go up, and a series whose
+older months changed has to be rebuilt with reset.
+
+Every record of the JSON Lines file holds a title's whole series, so update_from_jsonl doesn't parse the file again each
+time: it carries on from where its last update of the same file stopped, so it only parses the records written since.
+The whole file is read again if the line it stopped after is no longer there (the file was started again) or if some of
+the titles asked for are not in the index yet, which is safe because the months already counted are skipped.
+'''
+import bisect, json, os, sqlite3, threading
+
+# Default location of the index file, relative to where the generator is run from
+AGGREGATES_PATH = "pageview_aggregates.sqlite3"
+# The metrics that can be ranked, each has an index in both directions
+INDEXED_METRICS = ("average", "peak", "months", "total")
+
+"""
+A thread safe index of per article running aggregates stored in a SQLite file.
+@param: path: the path to the SQLite file, created if it does not exist. ":memory:" keeps the index in memory only
+"""
+class PageviewAggregates:
+    def __init__(self, path = AGGREGATES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        #the position the next new article of each access type gets, loaded the first time an access type is updated
+        self._next_position = {}
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS aggregates (
+                access TEXT, article TEXT, position INTEGER, total INTEGER, months INTEGER, peak INTEGER, average REAL,
+                first_month TEXT, last_month TEXT, last_views INTEGER,
+                PRIMARY KEY (access, article)) WITHOUT ROWID""")
+            for metric in INDEXED_METRICS:
+                self._connection.execute("CREATE INDEX IF NOT EXISTS aggregates_" + metric + "_desc ON aggregates (access, " + metric + " DESC, position)")
+                self._connection.execute("CREATE INDEX IF NOT EXISTS aggregates_" + metric + "_asc ON aggregates (access, " + metric + ", position)")
+            #where update_from_jsonl stopped reading each file and the last line it read there
+            self._connection.execute("CREATE TABLE IF NOT EXISTS read_offsets (path TEXT PRIMARY KEY, offset INTEGER, last_line BLOB)")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    #adds the months of items after the article's last month to its aggregates, the caller holds the lock and a transaction.
+    #position replaces the article's position if it is given. returns the number of months read
+    def _update(self, access, article, items, position = None):
+        row = self._connection.execute("""SELECT position, total, months, peak, first_month, last_month, last_views FROM aggregates
+            WHERE access=? AND article=?""", (access, article)).fetchone()
+        if row is None:
+            if position is None:
+                if access not in self._next_position:
+                    self._next_position[access] = self._connection.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM aggregates WHERE access=?",
+                                                                           (access,)).fetchone()[0]
+                position = self._next_position[access]
+                self._next_position[access] += 1
+            row = (position, 0, 0, -1, None, None, 0)
+        elif position is not None:
+            row = (position,) + row[1:]
+        position, total, months, peak, first_month, last_month, last_views = row
+        #items are sorted by timestamp, so everything before last_month has already been counted
+        new_items = items[bisect.bisect_left(items, last_month, key=lambda month: month["timestamp"]):] if last_month else items
+        for month in new_items:
+            views = month["views"]
+            if month["timestamp"] == last_month:
+                total += views - last_views
+            else:
+                total += views
+                months += 1
+                first_month = first_month or month["timestamp"]
+                last_month = month["timestamp"]
+            last_views = views
+            peak = max(peak, views)
+        average = total / months if months else -1.0
+        self._connection.execute("INSERT OR REPLACE INTO aggregates VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (access, article, position, total, months, peak, average, first_month, last_month, last_views))
+        return len(new_items)
+
+    """
+    Adds the new months of every article in series_by_title to the index in one transaction. Articles with no months are
+    added with nothing counted, so they still show up in "fewest months".
+    returns the number of months read, which is the number of new months plus one refreshed last month per article.
+    @param: access: the access type, e.g. "mobile"
+    @param: series_by_title: a dictionary of title to its list of monthly objects sorted by timestamp, each with "timestamp" and "views"
+    """
+    def update(self, access, series_by_title):
+        read = 0
+        with self._lock, self._connection:
+            for title, items in series_by_title.items():
+                read += self._update(access, title, list(items))
+        return read
+
+    #gives the articles of access the positions of their titles in titles and removes the ones not in titles, the caller
+    #holds the lock and a transaction. returns True if every title is in the index
+    def _set_order(self, access, titles):
+        positions = {title: position for position, title in enumerate(dict.fromkeys(titles))}
+        articles = [row[0] for row in self._connection.execute("SELECT article FROM aggregates WHERE access=?", (access,))]
+        self._connection.executemany("DELETE FROM aggregates WHERE access=? AND article=?",
+                                     [(access, article) for article in articles if article not in positions])
+        self._connection.executemany("UPDATE aggregates SET position=? WHERE access=? AND article=?",
+                                     [(positions[article], access, article) for article in articles if article in positions])
+        self._next_position[access] = len(positions)
+        return len(articles) - sum(article not in positions for article in articles) == len(positions)
+
+    #returns the offset update_from_jsonl can carry on reading jsonl_path from, 0 if the line it stopped after has changed
+    def _resume_offset(self, jsonl_path):
+        row = self._connection.execute("SELECT offset, last_line FROM read_offsets WHERE path=?", (jsonl_path,)).fetchone()
+        if row is None or row[0] > os.path.getsize(jsonl_path):
+            return 0
+        offset, last_line = row
+        with open(jsonl_path, "rb") as jsonl_file:
+            jsonl_file.seek(offset - len(last_line))
+            return offset if jsonl_file.read(len(last_line)) == last_line else 0
+
+    """
+    Adds the new months in a JSON Lines file from wikipedia_pageview_writer to the index, for each output in outputs.
+    Only outputs holding views per month can be added up this way, the cumulative output can't. Records marked failed
+    are skipped, their title is added once a later run writes it in full. Only the records written
+    after the ones the last update of this file read are parsed, see the top of this file.
+    returns the number of months read.
+    @param: jsonl_path: the path of the JSON Lines file
+    @param: outputs: the outputs to add, each stored under its own name as the access type
+    @param: titles: an optional array of titles, when given records of other titles are skipped, articles not in it are
+                    removed from the index and equal values are ranked in its order
+    """
+    def update_from_jsonl(self, jsonl_path, outputs = ("mobile", "desktop"), titles = None):
+        jsonl_path = os.path.abspath(jsonl_path)
+        positions = None if titles is None else {title: position for position, title in enumerate(dict.fromkeys(titles))}
+        read = 0
+        with self._lock, self._connection:
+            offset = self._resume_offset(jsonl_path)
+            if titles is not None:
+                #titles skipped by an earlier update with other titles are only in the part of the file already read
+                if not all([self._set_order(output, titles) for output in outputs]):
+                    offset = 0
+            last_line = b""
+            with open(jsonl_path, "rb") as jsonl_file:
+                jsonl_file.seek(offset)
+                for line in jsonl_file:
+                    #a line still being written is left for the next update
+                    if not line.endswith(b"\n"):
+                        break
+                    record = json.loads(line)
+                    title = record["title"]
+                    #a failed record only has the months that could be fetched, the ones already counted are kept
+                    if not record.get("failed") and (positions is None or title in positions):
+                        for output in outputs:
+                            read += self._update(output, title, list(record[output]), None if positions is None else positions[title])
+                    offset += len(line)
+                    last_line = line
+            if last_line:
+                self._connection.execute("INSERT OR REPLACE INTO read_offsets VALUES (?, ?, ?)", (jsonl_path, offset, last_line))
+        return read
+
+    #empties the index for access, or all of it if access is None, so it can be built again from scratch
+    def reset(self, access = None):
+        with self._lock, self._connection:
+            #every file has to be read from the start again to rebuild what is removed
+            self._connection.execute("DELETE FROM read_offsets")
+            if access is None:
+                self._connection.execute("DELETE FROM aggregates")
+                self._next_position.clear()
+            else:
+                self._connection.execute("DELETE FROM aggregates WHERE access=?", (access,))
+                self._next_position.pop(access, None)
+
+    #returns the aggregates of one article as a dictionary, or None if it is not in the index
+    def get(self, access, article):
+        with self._lock:
+            cursor = self._connection.execute("SELECT * FROM aggregates WHERE access=? AND article=?", (access, article))
+            row = cursor.fetchone()
+        return None if row is None else dict(zip([column[0] for column in cursor.description], row))
+
+    """
+    Checks the index against a dataset, e.g. the data the analysis loaded, by the number of months and the last month
+    of every article. An article whose data is missing or out of date in either one makes them differ.
+    returns True if the articles of access in the index are exactly the ones in months_by_article, with the same months.
+    @param: access: the access type, e.g. "mobile"
+    @param: months_by_article: a dictionary of article to a (months, last_month) tuple, last_month being None if it has no months
+    """
+    def matches(self, access, months_by_article):
+        with self._lock:
+            rows = self._connection.execute("SELECT article, months, last_month FROM aggregates WHERE access=?", (access,))
+            return {article: (months, last_month) for article, months, last_month in rows} == dict(months_by_article)
+
+    #returns the number of articles of access in the index
+    def count(self, access):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM aggregates WHERE access=?", (access,)).fetchone()[0]
+
+    def _select_k(self, access, metric, k, positive_only, largest):
+        if metric not in INDEXED_METRICS:
+            raise ValueError("can't rank by " + metric + ", only by one of " + ", ".join(INDEXED_METRICS))
+        query = "SELECT article FROM aggregates WHERE access=?" + (" AND " + metric + " > 0" if positive_only else "") + \
+            " ORDER BY " + metric + (" DESC" if largest else "") + ", position LIMIT ?"
+        with self._lock:
+            return [row[0] for row in self._connection.execute(query, (access, k))]
+
+    """
+    Finds the k articles of access with the largest value of metric, read straight off the metric's index.
+    returns a list of at most k article titles, largest value first. Equal values are returned in the order of the index's titles.
+    @param: access: the access type, e.g. "mobile"
+    @param: metric: one of INDEXED_METRICS
+    @param: k: the number of articles to return
+    @param: positive_only: if True only articles whose value is above 0 are returned, which leaves out articles with no data
+    """
+    def top_k(self, access, metric, k, positive_only = False):
+        return self._select_k(access, metric, k, positive_only, largest=True)
+
+    """
+    Finds the k articles of access with the smallest value of metric, read straight off the metric's index.
+    returns a list of at most k article titles, smallest value first. Equal values are returned in the order of the index's titles.
+    @param: access: the access type, e.g. "mobile"
+    @param: metric: one of INDEXED_METRICS
+    @param: k: the number of articles to return
+    @param: positive_only: if True only articles whose value is above 0 are returned, which leaves out articles with no data
+    """
+    def bottom_k(self, access, metric, k, positive_only = False):
+        return self._select_k(access, metric, k, positive_only, largest=False)
@@ -14,12 +14,16 @@ Chart 3: Fewest Months of Data - contains pages that have the fewest months of a
 These will all be relatively short time series, some may only have one month of data. 
 The graph will show the 10 articles with the fewest months of data for desktop access and the 10 articles with the fewest months of data for mobile access.
 '''
-#may need to install pandas and matplotlib before running this cell
-import pandas as pd
-import json
-import matplotlib.pyplot as plt
-from datetime import datetime
-import matplotlib.dates as mdates
+#may need to install numpy and matplotlib before running this cell. matplotlib is only imported once a chart is drawn,
+#so this file can be imported for its metrics and loaders without paying for it
+import argparse, json
+import os, time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from wikipedia_pageview_store import PageviewMatrix, load_store, store_paths, resample_matrix
+from wikipedia_pageview_metrics import compute_access_metrics, top_k, bottom_k
+import wikipedia_pageview_timeseries_generator
+from wikipedia_pageview_aggregates import PageviewAggregates, AGGREGATES_PATH
 
 CHART_1_OUTPUT_FNAME = "highest_lowest_average_views_by_access_type_1.png"
 CHART_1_TITLE =  "Highest and lowest average views for mobile and desktop"
@@ -33,6 +37,12 @@ CHART_3_TITLE = "Webpages with lowest data availibility"
 CHART_Y_AXIS_TITLE =  "Webpage Views"
 MOBILE_DATA_PATH = "dino_monthly_mobile_201507-202210.json"
 DESKTOP_DATA_PATH = "dino_monthly_desktop_201507-202210.json"
+#base paths of the columnar stores written by the generator alongside the JSON files, loaded instead of the JSON when they exist.
+#they follow the generator's granularity and dates, so a daily run's stores are found and summed into months
+MOBILE_STORE_PATH = wikipedia_pageview_timeseries_generator.MOBILE_STORE_PATH
+DESKTOP_STORE_PATH = wikipedia_pageview_timeseries_generator.DESKTOP_STORE_PATH
+#the charts are drawn from monthly data, stores holding finer (e.g. daily) data are summed into months when they are loaded
+ANALYSIS_GRANULARITY = "monthly"
 
 #this function takes in paths to two JSONS generated in the wikipedia_pageview_timeseries_generator script and loads them
 def load_data(mobile_path = MOBILE_DATA_PATH, desktop_path = DESKTOP_DATA_PATH):
@@ -40,6 +50,33 @@ def load_data(mobile_path = MOBILE_DATA_PATH, desktop_path = DESKTOP_DATA_PATH):
     mobile_json =  json.load(open(mobile_path))
     return desktop_json, mobile_json
 
+#this function loads the columnar stores written by the generator. The returned PageviewMatrix objects are memory mapped,
+#so this takes almost no time, and they can be used anywhere the dictionaries from load_data are used.
+#stores finer than granularity are resampled to it, which reads them into memory
+def load_store_data(mobile_store = MOBILE_STORE_PATH, desktop_store = DESKTOP_STORE_PATH, granularity = ANALYSIS_GRANULARITY):
+    matrices = []
+    for store in [desktop_store, mobile_store]:
+        matrix = load_store(store)
+        if matrix.granularity != granularity:
+            matrix = resample_matrix(matrix, granularity)
+        matrices.append(matrix)
+    return matrices[0], matrices[1]
+
+#returns True if every file of the stores for both access types exists
+def stores_exist(mobile_store = MOBILE_STORE_PATH, desktop_store = DESKTOP_STORE_PATH):
+    return all(os.path.exists(path) for path in store_paths(mobile_store) + store_paths(desktop_store))
+
+#returns a dictionary of each title in data to a (months, last_month) tuple, what PageviewAggregates.matches checks.
+#data is a PageviewMatrix or a dictionary of title to monthly objects, last_month is None for a title with no months
+def months_by_article(data):
+    if not isinstance(data, PageviewMatrix):
+        return {title: (len(series), series[-1]["timestamp"] if series else None) for title, series in data.items()}
+    mask = np.asarray(data.mask)
+    months = mask.sum(axis=1)
+    last_columns = mask.shape[1] - 1 - mask[:, ::-1].argmax(axis=1) if mask.shape[1] else months
+    return {article: (int(months[row]), data.timestamps[last_columns[row]] if months[row] else None)
+            for row, article in enumerate(data.articles)}
+
 #will calculate the average view count of a webpage, returns -1 if there is no time series data available for the webpage.
 #timeseries in this case is an array of JSON objects returned from API calls to the wikipedia API
 def average_page_view_calculator(timeseries):
@@ -64,32 +101,101 @@ def max_page_view_calculator(timeseries):
 def fewest_months_of_data_calculator(timeseries):
     return len(timeseries)
 
+#when a chart has more lines than this they are drawn as one LineCollection instead of one artist per line, and the legend is left out
+LINE_COLLECTION_THRESHOLD = 50
+#lines with more points than this are thinned out to about this many points before they are drawn
+MAX_POINTS_PER_LINE = 2000
+#set to True to open a window for each chart as well as saving it, only possible with a display and when rendering serially
+SHOW_CHARTS = False
+#the number of worker processes generate_all_charts renders charts in, 1 renders them one after another in this process
+RENDER_PROCESSES = 3
+
+#returns every step-th point of a line, always keeping the last one, so that long lines stay cheap to draw
+def decimate(xs, ys, max_points = MAX_POINTS_PER_LINE):
+    if len(xs) <= max_points:
+        return xs, ys
+    step = -(-len(xs) // max_points)
+    keep = list(range(0, len(xs), step))
+    if keep[-1] != len(xs) - 1:
+        keep.append(len(xs) - 1)
+    return [xs[i] for i in keep], [ys[i] for i in keep]
+
 #this function will take a dictionary containing names and timeseries and plot them all together on a matplotlib plot
 #also will take title of the plot and ylabel of the plot and an output file name to save the image to.
 #if a definite X-Axis is to be set, set xaxis to a non-null value, a list.
-def time_series_plotter(name_to_timeseries, title, ylabel, output_f_name, xaxis = None):
-    fig = plt.figure(figsize=(10, 10))
+#the figure is built with matplotlib's object oriented API on an Agg canvas, so nothing touches pyplot's global state and
+#no display is needed unless show is True. returns the number of seconds it took to draw and save the chart
+def time_series_plotter(name_to_timeseries, title, ylabel, output_f_name, xaxis = None, show = SHOW_CHARTS):
+    render_start = time.perf_counter()
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import LineCollection
+    if show:
+        import matplotlib.pyplot as plt
+        fig = plt.figure(figsize=(10, 10))
+    else:
+        fig = Figure(figsize=(10, 10))
+        FigureCanvasAgg(fig)
     ax = fig.add_subplot(1,1,1)
-    print(xaxis)
+    #every timestamp gets a position on the x axis in time order, either from xaxis or from all the timestamps being plotted
     if xaxis: #if we want to set a definite x axis we can do so.
-        plt.xticks([i for i in range(len(xaxis))],xaxis)
+        labels = list(xaxis)
+    else:
+        labels = sorted({month["timestamp"] for timeseries in name_to_timeseries.values() for month in timeseries})
+    position_of = {label: position for position, label in enumerate(labels)}
+    lines = []
     for name, timeseries in name_to_timeseries.items():
-        #timestamps = [datetime.strptime(month["timestamp"], "%Y%M%d%S") for month in timeseries]
-        timestamps = [month["timestamp"] for month in timeseries]
-        
-        views = [month["views"] for month in timeseries]
-        if len(timestamps) == 1:
-            plt.scatter(timestamps, views, label=name)
+        timestamps = [position_of[month["timestamp"]] for month in timeseries if month["timestamp"] in position_of]
+        views = [month["views"] for month in timeseries if month["timestamp"] in position_of]
+        timestamps, views = decimate(timestamps, views)
+        if len(name_to_timeseries) > LINE_COLLECTION_THRESHOLD:
+            lines.append(list(zip(timestamps, views)))
+        elif len(timestamps) == 1:
+            ax.scatter(timestamps, views, label=name)
         else:
-            plt.plot(timestamps, views, label=name)
-    ax.xaxis.set_major_locator(mdates.DayLocator(interval=3)) #this will set our x labels not to be so close together and only every 3 months
-    plt.legend()
-    plt.xticks(rotation=45, ha='right')
-    plt.title(title)
-    plt.xlabel("Date")
-    plt.ylabel(ylabel)
-    plt.savefig(output_f_name)
-    plt.show()
+            ax.plot(timestamps, views, label=name)
+    if lines:
+        ax.add_collection(LineCollection(lines, linewidths=0.5, alpha=0.5))
+        ax.autoscale_view()
+    else:
+        ax.legend()
+    #this will set our x labels not to be so close together and only every 3 months
+    ax.set_xticks(range(0, len(labels), 3))
+    ax.set_xticklabels(labels[::3], rotation=45, ha='right')
+    ax.set_title(title)
+    ax.set_xlabel("Date")
+    ax.set_ylabel(ylabel)
+    fig.savefig(output_f_name)
+    elapsed = time.perf_counter() - render_start
+    if show:
+        plt.show()
+    return elapsed
+
+#draws one chart from the keyword arguments of time_series_plotter, for use in a worker process. Returns (output_f_name, seconds)
+def _render_chart(chart):
+    return chart["output_f_name"], time_series_plotter(show=False, **chart)
+
+"""
+Draws several independent charts, in a pool of worker processes when processes is more than 1. Each chart is drawn
+headless and the time each one took is printed.
+@param: charts: an array of dictionaries, each holding the keyword arguments of time_series_plotter for one chart
+@param: processes: the number of worker processes, 1 draws the charts one after another in this process
+@returns a dictionary mapping each chart's output_f_name to the number of seconds it took to draw
+"""
+def render_charts(charts, processes = RENDER_PROCESSES):
+    if processes <= 1 or len(charts) <= 1:
+        timings = dict(_render_chart(chart) for chart in charts)
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, len(charts))) as executor:
+            timings = dict(executor.map(_render_chart, charts))
+    for output_f_name, seconds in timings.items():
+        print("rendered " + output_f_name + " in " + str(round(seconds, 3)) + "s")
+    return timings
+
+#computes every metric for both access types in one pass so that all three charts can share them.
+#desktop_json and mobile_json can be the dictionaries from load_data or the matrices from load_store_data
+def compute_chart_metrics(desktop_json, mobile_json):
+    return compute_access_metrics({"desktop": desktop_json, "mobile": mobile_json})
 
 """
 This function will process the JSON data and calculate the information needed to generate chart 1 in the top comment of this file.
@@ -98,32 +204,37 @@ This function will process the JSON data and calculate the information needed to
 @param: output_f_name: the output file name or path to which the chart will be saved
 @param: chart_y_axis: the y axis title of the chart
 @param: chart_title: the charts main title
-@returns None, will save png file to output_f_name and show an image of the chart in the terminal as well
+@param: metrics: the metrics from compute_chart_metrics, computed here if neither metrics nor aggregates are given
+@param: render: if False the chart is not drawn, instead the keyword arguments for time_series_plotter are returned
+@param: aggregates: an optional PageviewAggregates kept up to date by the generator, the articles are picked from its
+        indexes instead of from metrics and desktop_json and mobile_json are only used for the picked articles' time series
+@returns None, will save png file to output_f_name and show an image of the chart if SHOW_CHARTS is set
 """
-def generate_average_chart(desktop_json, mobile_json, output_f_name = CHART_1_OUTPUT_FNAME, chart_y_axis = CHART_Y_AXIS_TITLE, chart_title=CHART_1_TITLE):
-        #Lets create a dictionary which contains each dinosaur and its average views along the timeseries. 
-    average_page_views_desktop = {}
-    for name,timeseries in desktop_json.items():
-        average= average_page_view_calculator(timeseries)
-        if average > 0: #this will exclude any names with no timeseries available. KEY ASSUMPTION
-            average_page_views_desktop[name] = average
-
-    average_page_views_mobile = {}
-    for name,timeseries in mobile_json.items():
-        average= average_page_view_calculator(timeseries)
-        if average > 0: #this will exclude any names with no timeseries available. KEY ASSUMPTION
-            average_page_views_mobile[name] = average
-    #lets identify which dinosaur had highest average page views on desktop using the above dict
-    most_popular_desktop = max(average_page_views_desktop, key=average_page_views_desktop.get)
-    most_popular_mobile = max(average_page_views_mobile, key=average_page_views_mobile.get)
-    least_popular_desktop = min(average_page_views_desktop, key=average_page_views_desktop.get)
-    least_popular_mobile = min(average_page_views_mobile, key=average_page_views_mobile.get)
+def generate_average_chart(desktop_json, mobile_json, output_f_name = CHART_1_OUTPUT_FNAME, chart_y_axis = CHART_Y_AXIS_TITLE, chart_title=CHART_1_TITLE, metrics = None, render = True, aggregates = None):
+    #lets identify which dinosaur had highest and lowest average page views on desktop and mobile.
+    #an average of 0 or less will exclude any names with no timeseries available. KEY ASSUMPTION
+    if aggregates is not None:
+        most_popular_desktop = aggregates.top_k("desktop", "average", 1, positive_only=True)[0]
+        most_popular_mobile = aggregates.top_k("mobile", "average", 1, positive_only=True)[0]
+        least_popular_desktop = aggregates.bottom_k("desktop", "average", 1, positive_only=True)[0]
+        least_popular_mobile = aggregates.bottom_k("mobile", "average", 1, positive_only=True)[0]
+    else:
+        if metrics is None:
+            metrics = compute_chart_metrics(desktop_json, mobile_json)
+        desktop, mobile = metrics["desktop"], metrics["mobile"]
+        most_popular_desktop = desktop.articles[top_k(desktop.mean, 1, desktop.mean > 0)[0]]
+        most_popular_mobile = mobile.articles[top_k(mobile.mean, 1, mobile.mean > 0)[0]]
+        least_popular_desktop = desktop.articles[bottom_k(desktop.mean, 1, desktop.mean > 0)[0]]
+        least_popular_mobile = mobile.articles[bottom_k(mobile.mean, 1, mobile.mean > 0)[0]]
     print(most_popular_desktop, most_popular_mobile, least_popular_desktop, least_popular_mobile)
 
     #Maximum Average and Minimum Average
     name_to_timeseries = {str(most_popular_desktop)+"_Desktop": desktop_json[most_popular_desktop], str(most_popular_mobile)+"_Mobile": mobile_json[most_popular_mobile], \
         str(least_popular_desktop)+"_Desktop": desktop_json[least_popular_desktop], str(least_popular_mobile)+"_Mobile": mobile_json[least_popular_mobile]}
-    time_series_plotter(name_to_timeseries, chart_title, chart_y_axis, output_f_name)
+    chart = {"name_to_timeseries": name_to_timeseries, "title": chart_title, "ylabel": chart_y_axis, "output_f_name": output_f_name}
+    if not render:
+        return chart
+    time_series_plotter(**chart)
 
 """
 This function will process the JSON data and calculate the information needed to generate chart 2 in the top comment of this file.
@@ -132,24 +243,23 @@ This function will process the JSON data and calculate the information needed to
 @param: output_f_name: the output file name or path to which the chart will be saved
 @param: chart_y_axis: the y axis title of the chart
 @param: chart_title: the charts main title
-@returns None, will save png file to output_f_name and show an image of the chart in the terminal as well
+@param: metrics: the metrics from compute_chart_metrics, computed here if neither metrics nor aggregates are given
+@param: render: if False the chart is not drawn, instead the keyword arguments for time_series_plotter are returned
+@param: aggregates: an optional PageviewAggregates kept up to date by the generator, the articles are picked from its
+        indexes instead of from metrics and desktop_json and mobile_json are only used for the picked articles' time series
+@returns None, will save png file to output_f_name and show an image of the chart if SHOW_CHARTS is set
 """
-def generate_peak_viewers_chart(desktop_json, mobile_json, output_f_name = CHART_2_OUTPUT_FNAME, chart_y_axis = CHART_Y_AXIS_TITLE, chart_title = CHART_2_TITLE):
-    #Lets create a dictionary which contains each dinosaur and its highest peak views along the timeseries. 
-    highest_page_views_desktop = {}
-    for name,timeseries in desktop_json.items():
-        highest= max_page_view_calculator(timeseries)
-        if highest > 0: #this will exclude any names with no timeseries available.
-            highest_page_views_desktop[name] = highest
-
-    highest_page_views_mobile = {}
-    for name,timeseries in mobile_json.items():
-        highest= max_page_view_calculator(timeseries)
-        if highest > 0: #this will exclude any names with no timeseries available.
-            highest_page_views_mobile[name] = highest
-    #lets identify which 10 dinosaur had highest peak viewership on desktop and mobile
-    highest_peak_desktop = sorted(highest_page_views_desktop, key=highest_page_views_desktop.get, reverse=True)[:10]
-    highest_peak_mobile = sorted(highest_page_views_mobile, key=highest_page_views_mobile.get, reverse=True)[:10]
+def generate_peak_viewers_chart(desktop_json, mobile_json, output_f_name = CHART_2_OUTPUT_FNAME, chart_y_axis = CHART_Y_AXIS_TITLE, chart_title = CHART_2_TITLE, metrics = None, render = True, aggregates = None):
+    #lets identify which 10 dinosaur had highest peak viewership on desktop and mobile, a peak of 0 or less will exclude any names with no timeseries available.
+    if aggregates is not None:
+        highest_peak_desktop = aggregates.top_k("desktop", "peak", 10, positive_only=True)
+        highest_peak_mobile = aggregates.top_k("mobile", "peak", 10, positive_only=True)
+    else:
+        if metrics is None:
+            metrics = compute_chart_metrics(desktop_json, mobile_json)
+        desktop, mobile = metrics["desktop"], metrics["mobile"]
+        highest_peak_desktop = [desktop.articles[i] for i in top_k(desktop.max, 10, desktop.max > 0)]
+        highest_peak_mobile = [mobile.articles[i] for i in top_k(mobile.max, 10, mobile.max > 0)]
     #Highest peak by access type, lets combine them with their raw timeseries data for plotting.
     name_to_timeseries = {}
     for name in highest_peak_desktop:
@@ -157,7 +267,10 @@ def generate_peak_viewers_chart(desktop_json, mobile_json, output_f_name = CHART
 
     for name in highest_peak_mobile:
         name_to_timeseries[name + "_Mobile"] = mobile_json[name]
-    time_series_plotter(name_to_timeseries, chart_title, chart_y_axis, output_f_name)
+    chart = {"name_to_timeseries": name_to_timeseries, "title": chart_title, "ylabel": chart_y_axis, "output_f_name": output_f_name}
+    if not render:
+        return chart
+    time_series_plotter(**chart)
 
 
 """
@@ -167,23 +280,25 @@ This function will process the JSON data and calculate the information needed to
 @param: output_f_name: the output file name or path to which the chart will be saved
 @param: chart_y_axis: the y axis title of the chart
 @param: chart_title: the charts main title
-@returns None, will save png file to output_f_name and show an image of the chart in the terminal as well
+@param: metrics: the metrics from compute_chart_metrics, computed here if neither metrics nor aggregates are given
+@param: render: if False the chart is not drawn, instead the keyword arguments for time_series_plotter are returned
+@param: aggregates: an optional PageviewAggregates kept up to date by the generator, the articles are picked from its
+        indexes instead of from metrics and desktop_json and mobile_json are only used for the picked articles' time series
+@returns None, will save png file to output_f_name and show an image of the chart if SHOW_CHARTS is set
 """
-def generate_least_data_chart(desktop_json, mobile_json, output_f_name = CHART_3_OUTPUT_FNAME, chart_y_axis = CHART_Y_AXIS_TITLE, chart_title = CHART_3_TITLE):
-    #Lets create a dictionary which contains each dinosaur and the number of months in its timeseries. 
-    num_months_desktop = {}
-    for name,timeseries in desktop_json.items():
-        num_months= fewest_months_of_data_calculator(timeseries)
-        num_months_desktop[name] = num_months
-
-    num_months_mobile = {}
-    for name,timeseries in mobile_json.items():
-        num_months= fewest_months_of_data_calculator(timeseries)
-        num_months_mobile[name] = num_months
+def generate_least_data_chart(desktop_json, mobile_json, output_f_name = CHART_3_OUTPUT_FNAME, chart_y_axis = CHART_Y_AXIS_TITLE, chart_title = CHART_3_TITLE, metrics = None, render = True, aggregates = None):
     #lets identify which 10 dinosaur had least data on desktop and mobile
-    lowest_months_desktop = sorted(num_months_desktop, key=num_months_desktop.get)[:10]
-    lowest_months_mobile = sorted(num_months_mobile, key=num_months_mobile.get)[:10]
-    full_data_range = desktop_json[sorted(num_months_desktop,  key=num_months_desktop.get)[-1]]
+    if aggregates is not None:
+        lowest_months_desktop = aggregates.bottom_k("desktop", "months", 10)
+        lowest_months_mobile = aggregates.bottom_k("mobile", "months", 10)
+        full_data_range = desktop_json[aggregates.top_k("desktop", "months", 1)[0]]
+    else:
+        if metrics is None:
+            metrics = compute_chart_metrics(desktop_json, mobile_json)
+        desktop, mobile = metrics["desktop"], metrics["mobile"]
+        lowest_months_desktop = [desktop.articles[i] for i in bottom_k(desktop.count, 10)]
+        lowest_months_mobile = [mobile.articles[i] for i in bottom_k(mobile.count, 10)]
+        full_data_range = desktop_json[desktop.articles[top_k(desktop.count, 1)[0]]]
     xaxis = [month["timestamp"] for month in full_data_range]
     print(lowest_months_desktop, lowest_months_mobile)
     #lets combine the lowest month count for mobile and desktop together so we can plot it
@@ -193,12 +308,60 @@ def generate_least_data_chart(desktop_json, mobile_json, output_f_name = CHART_3
 
     for name in lowest_months_mobile:
         name_to_timeseries[name + "_Mobile"] = mobile_json[name]
-    time_series_plotter(name_to_timeseries, chart_title, chart_y_axis , output_f_name, xaxis)
+    chart = {"name_to_timeseries": name_to_timeseries, "title": chart_title, "ylabel": chart_y_axis, "output_f_name": output_f_name, "xaxis": xaxis}
+    if not render:
+        return chart
+    time_series_plotter(**chart)
 
-desktop_json, mobile_json = load_data()
-generate_average_chart(desktop_json, mobile_json)
-generate_peak_viewers_chart(desktop_json, mobile_json)
-generate_least_data_chart(desktop_json, mobile_json)
+#works out all three charts from the shared metrics, or from the indexes of aggregates if it is given, and then draws them in parallel with render_charts
+def generate_all_charts(desktop_json, mobile_json, metrics = None, processes = RENDER_PROCESSES, aggregates = None):
+    if metrics is None and aggregates is None:
+        metrics = compute_chart_metrics(desktop_json, mobile_json)
+    charts = [generate_average_chart(desktop_json, mobile_json, metrics=metrics, render=False, aggregates=aggregates),
+              generate_peak_viewers_chart(desktop_json, mobile_json, metrics=metrics, render=False, aggregates=aggregates),
+              generate_least_data_chart(desktop_json, mobile_json, metrics=metrics, render=False, aggregates=aggregates)]
+    return render_charts(charts, processes)
 
+"""
+Draws all three charts from the command line, from the columnar stores if they exist and the JSON files otherwise.
+@param: argv: the command line arguments, sys.argv[1:] if None
+"""
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Draw the average, peak and fewest months charts from the generator's output")
+    parser.add_argument("--mobile-store", default=MOBILE_STORE_PATH)
+    parser.add_argument("--desktop-store", default=DESKTOP_STORE_PATH)
+    parser.add_argument("--mobile-json", default=MOBILE_DATA_PATH, help="read when the stores don't exist")
+    parser.add_argument("--desktop-json", default=DESKTOP_DATA_PATH, help="read when the stores don't exist")
+    parser.add_argument("--processes", type=int, default=RENDER_PROCESSES, help="worker processes to draw the charts in")
+    parser.add_argument("--show", action="store_true", default=SHOW_CHARTS, help="open a window for each chart as well as saving it")
+    parser.add_argument("--aggregates", default=AGGREGATES_PATH, help="the aggregate index written by the generator, used instead of computing the metrics when it exists")
+    args = parser.parse_args(argv)
+    if stores_exist(args.mobile_store, args.desktop_store):
+        desktop_json, mobile_json = load_store_data(args.mobile_store, args.desktop_store)
+    else:
+        desktop_json, mobile_json = load_data(args.mobile_json, args.desktop_json)
+    #the generator keeps the aggregate index up to date as new months arrive, so the chart articles can be read off its
+    #indexes. Without it, or if its articles or their months differ from the data that was loaded, every metric is
+    #computed once here and shared by all three charts
+    aggregates = None
+    metrics = None
+    if args.aggregates and os.path.exists(args.aggregates):
+        aggregates = PageviewAggregates(args.aggregates)
+        if not (aggregates.matches("desktop", months_by_article(desktop_json)) and aggregates.matches("mobile", months_by_article(mobile_json))):
+            print(args.aggregates + " doesn't agree with the loaded data, computing the metrics instead")
+            aggregates.close()
+            aggregates = None
+    if aggregates is None:
+        metrics = compute_chart_metrics(desktop_json, mobile_json)
+    try:
+        if args.show:
+            for generate_chart in [generate_average_chart, generate_peak_viewers_chart, generate_least_data_chart]:
+                time_series_plotter(show=True, **generate_chart(desktop_json, mobile_json, metrics=metrics, render=False, aggregates=aggregates))
+        else:
+            generate_all_charts(desktop_json, mobile_json, metrics, args.processes, aggregates)
+    finally:
+        if aggregates is not None:
+            aggregates.close()
 
-        
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+'''this file benchmarks the generator and the analysis stage against wikipedia_pageview_simulator
+
+For each number of articles it runs the whole pipeline on made up titles, served by a local PageviewSimulator:
+    generator  stream_monthly_pageviews for all three outputs, timing the wall clock and the requests per second
+    analysis   building the desktop and mobile stores from the stream, loading them, computing every metric and
+               picking the articles for all three charts
+Each size runs in a fresh process so the peak RSS reported for it belongs to that size alone. The simulator runs in
+this process so serving requests doesn't count against the pipeline's memory.
+
+Results are saved as JSON, and a previous results file can be passed with --compare to flag any measurement that got
+worse by more than --tolerance, e.g.
+    python wikipedia_pageview_benchmark.py --sizes 1000 10000 --output new.json --compare benchmark_results.json
+Results are only compared if they were run with the same simulator and client settings, pass --allow-config-mismatch
+to compare them anyway.
+'''
+import argparse, contextlib, json, multiprocessing, os, platform, resource, sys, tempfile, time
+from datetime import datetime, timezone
+from wikipedia_pageview_simulator import PageviewSimulator, synthetic_titles
+
+BENCHMARK_SIZES = (1000, 10000, 100000)
+BENCHMARK_RESULTS_PATH = "benchmark_results.json"
+# The simulator is local, so the benchmark is allowed to go well past the real API's 100 requests per second
+BENCHMARK_RATE_LIMIT = 5000.0
+BENCHMARK_MAX_WORKERS = 32
+# A measurement is a regression if it is this much worse than in the results it is compared with
+REGRESSION_TOLERANCE = 0.2
+# The measurements compared between runs and whether a bigger value is better
+COMPARED_MEASUREMENTS = {
+    "requests_per_second": True,
+    "generator_seconds": False,
+    "analysis_seconds": False,
+    "peak_rss_mb": False,
+}
+
+#returns the peak resident set size of this process so far in megabytes. ru_maxrss is in kilobytes on Linux and bytes on macOS
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+"""
+Runs the generator and the analysis stage on n made up titles and measures them. Meant to be run in a fresh process.
+returns a dictionary of measurements for this size.
+@param: n: the number of articles
+@param: endpoint_url: the URL of a running PageviewSimulator
+@param: workdir: a directory to write the stream and the stores to
+@param: max_workers: the number of requests allowed in flight at once
+@param: rate_limit: the maximum number of requests sent per second
+"""
+def benchmark_size(n, endpoint_url, workdir, max_workers = BENCHMARK_MAX_WORKERS, rate_limit = BENCHMARK_RATE_LIMIT):
+    from wikipedia_pageview_timeseries_generator import make_client, stream_monthly_pageviews
+    from wikipedia_pageview_store import jsonl_to_store, load_store
+    from wikipedia_pageview_metrics import compute_access_metrics, top_k, bottom_k
+    titles = synthetic_titles(n)
+    stream_path = os.path.join(workdir, "benchmark_" + str(n) + ".jsonl")
+    client = make_client(max_workers, rate_limit, endpoint_url)
+    generator_start = time.perf_counter()
+    #the generator prints a line for every title it can't find, which would only measure the terminal
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        written = stream_monthly_pageviews(stream_path, titles, max_workers=max_workers, client=client, resume=False)
+    generator_seconds = time.perf_counter() - generator_start
+    stats = client.stats()
+    client.close()
+
+    analysis_start = time.perf_counter()
+    matrices = {}
+    for output in ["desktop", "mobile"]:
+        store_path = os.path.join(workdir, "benchmark_" + str(n) + "_" + output)
+        jsonl_to_store(stream_path, output, store_path, titles=titles)
+        matrices[output] = load_store(store_path)
+    store_seconds = time.perf_counter() - analysis_start
+    metrics = compute_access_metrics(matrices)
+    for access_metrics in metrics.values():
+        top_k(access_metrics.mean, 1, access_metrics.mean > 0)
+        bottom_k(access_metrics.mean, 1, access_metrics.mean > 0)
+        top_k(access_metrics.max, 10, access_metrics.max > 0)
+        bottom_k(access_metrics.count, 10)
+    analysis_seconds = time.perf_counter() - analysis_start
+    return {
+        "articles": n,
+        "titles_written": written,
+        "requests": stats["requests"],
+        "retries": stats["retries"],
+        "failures": stats["failures"],
+        "requests_per_second": stats["requests"] / generator_seconds if generator_seconds else 0.0,
+        "generator_seconds": generator_seconds,
+        "store_seconds": store_seconds,
+        "analysis_seconds": analysis_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+#returns a list of strings, one for every simulator or client setting that differs between two sets of results.
+#sizes is left out since only the sizes both ran are compared
+def config_differences(results, baseline):
+    config, baseline_config = results.get("config", {}), baseline.get("config", {})
+    return [setting + " is " + str(config.get(setting)) + " but was " + str(baseline_config.get(setting))
+            for setting in sorted(set(config) | set(baseline_config))
+            if setting != "sizes" and config.get(setting) != baseline_config.get(setting)]
+
+"""
+Compares two sets of benchmark results size by size. Results run with different settings, e.g. another simulated
+latency or rate limit, measure different things, so they are refused unless allow_config_mismatch is set.
+returns a list of strings, one for every measurement that got worse by more than tolerance.
+raises ValueError if the settings of results and baseline differ and allow_config_mismatch is False.
+@param: results: the results of this run, as written by run_benchmarks
+@param: baseline: earlier results to compare against
+@param: tolerance: how much worse, as a share of the baseline value, a measurement can get before it is reported
+@param: allow_config_mismatch: if True results run with different settings are compared anyway
+"""
+def find_regressions(results, baseline, tolerance = REGRESSION_TOLERANCE, allow_config_mismatch = False):
+    differences = config_differences(results, baseline)
+    if differences and not allow_config_mismatch:
+        raise ValueError("the results were run with different settings than the baseline: " + "; ".join(differences))
+    regressions = []
+    baseline_by_size = {result["articles"]: result for result in baseline["results"]}
+    for result in results["results"]:
+        previous = baseline_by_size.get(result["articles"])
+        if previous is None:
+            continue
+        for measurement, bigger_is_better in COMPARED_MEASUREMENTS.items():
+            old, new = previous.get(measurement), result.get(measurement)
+            if not old or new is None:
+                continue
+            change = (old - new) / old if bigger_is_better else (new - old) / old
+            if change > tolerance:
+                regressions.append(str(result["articles"]) + " articles: " + measurement + " went from " + str(round(old, 3)) +
+                                   " to " + str(round(new, 3)) + " (" + str(round(change * 100)) + "% worse)")
+    return regressions
+
+"""
+Starts a simulator and benchmarks every size in sizes, each in its own process.
+returns the results as a dictionary, ready to be saved as JSON.
+@param: sizes: an array of article counts
+@param: latency: the number of seconds the simulator delays each response by
+@param: error_rate: the share of requests the simulator fails with a 500
+@param: rate_limited_rate: the share of requests the simulator turns away with a 429
+@param: missing_rate: the share of titles the simulator has no data for
+@param: max_workers: the number of requests allowed in flight at once
+@param: rate_limit: the maximum number of requests sent per second
+"""
+def run_benchmarks(sizes = BENCHMARK_SIZES, latency = 0.0, error_rate = 0.0, rate_limited_rate = 0.0, missing_rate = 0.001,
+                   max_workers = BENCHMARK_MAX_WORKERS, rate_limit = BENCHMARK_RATE_LIMIT):
+    config = {"sizes": list(sizes), "latency": latency, "error_rate": error_rate, "rate_limited_rate": rate_limited_rate,
+              "missing_rate": missing_rate, "max_workers": max_workers, "rate_limit": rate_limit}
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with PageviewSimulator(latency=latency, error_rate=error_rate, rate_limited_rate=rate_limited_rate, retry_after=0,
+                           missing_rate=missing_rate) as simulator, tempfile.TemporaryDirectory() as workdir:
+        for n in sizes:
+            with context.Pool(1) as pool:
+                result = pool.apply(benchmark_size, (n, simulator.url, workdir, max_workers, rate_limit))
+            print(str(n) + " articles: " + str(round(result["requests_per_second"])) + " requests/s, generator " +
+                  str(round(result["generator_seconds"], 2)) + "s, analysis " + str(round(result["analysis_seconds"], 2)) +
+                  "s, peak RSS " + str(round(result["peak_rss_mb"])) + "MB")
+            results.append(result)
+    return {"created": datetime.now(timezone.utc).isoformat(), "python": platform.python_version(), "platform": platform.platform(),
+            "config": config, "results": results}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pageview generator and analysis against a local simulator")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(BENCHMARK_SIZES), help="numbers of articles to benchmark")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the simulator delays every response by")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail with a 500")
+    parser.add_argument("--rate-limited-rate", type=float, default=0.0, help="share of requests turned away with a 429")
+    parser.add_argument("--missing-rate", type=float, default=0.001, help="share of titles with no data")
+    parser.add_argument("--max-workers", type=int, default=BENCHMARK_MAX_WORKERS)
+    parser.add_argument("--rate-limit", type=float, default=BENCHMARK_RATE_LIMIT)
+    parser.add_argument("--output", default=BENCHMARK_RESULTS_PATH, help="where to save the results")
+    parser.add_argument("--compare", help="earlier results to check this run against")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument("--allow-config-mismatch", action="store_true", help="compare with --compare even if it was run with other settings")
+    args = parser.parse_args()
+    results = run_benchmarks(args.sizes, args.latency, args.error_rate, args.rate_limited_rate, args.missing_rate,
+                             args.max_workers, args.rate_limit)
+    with open(args.output, "w") as results_file:
+        json.dump(results, results_file, indent=4)
+    print("results saved to " + args.output)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        differences = config_differences(results, baseline)
+        if differences and not args.allow_config_mismatch:
+            print("NOT COMPARED, " + args.compare + " was run with other settings: " + "; ".join(differences))
+            sys.exit(2)
+        for difference in differences:
+            print("WARNING " + args.compare + " was run with other settings: " + difference)
+        regressions = find_regressions(results, baseline, args.tolerance, args.allow_config_mismatch)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        sys.exit(1 if regressions else 0)
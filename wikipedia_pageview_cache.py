@@ -0,0 +1,127 @@
+'''this file contains the on disk response cache used by wikipedia_pageview_timeseries_generator
+
+Past months of pageviews never change, so there is no reason to download the whole date range again on every run.
+Every item the API returns is kept in a SQLite file keyed by (project, access, agent, article, granularity),
+together with the date range that has already been requested for that key. On a re-run only the months after the
+end of that range are requested and merged in, and a key whose range already covers the request is not requested at all.
+'''
+import sqlite3, threading
+from wikipedia_pageview_client import is_not_found_response
+
+# Default location of the cache file, relative to where the generator is run from
+PAGEVIEW_CACHE_PATH = "pageview_cache.sqlite3"
+
+# The fields of a monthly item in the order the API returns them
+ITEM_FIELDS = ["project", "article", "granularity", "timestamp", "access", "agent", "views"]
+
+"""
+A thread safe cache of per-article pageview items stored in a SQLite file.
+Keeps a count of how many requests were answered entirely from the cache (hits), needed only the months after
+the cached range (tail refreshes) and had to be requested in full (misses).
+@param: path: the path to the SQLite file, created if it does not exist. ":memory:" keeps the cache in memory only
+"""
+class PageviewCache:
+    def __init__(self, path = PAGEVIEW_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.tail_refreshes = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS pageviews (
+                project TEXT, access TEXT, agent TEXT, article TEXT, granularity TEXT, timestamp TEXT, views INTEGER,
+                PRIMARY KEY (project, access, agent, article, granularity, timestamp)) WITHOUT ROWID""")
+            #the start and end of the date range that has been requested so far for each key, even if it returned no data
+            self._connection.execute("""CREATE TABLE IF NOT EXISTS coverage (
+                project TEXT, access TEXT, agent TEXT, article TEXT, granularity TEXT, start TEXT, end TEXT,
+                PRIMARY KEY (project, access, agent, article, granularity)) WITHOUT ROWID""")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    #returns a one line summary of the hit, tail refresh and miss counts
+    def report(self):
+        return "cache hits: " + str(self.hits) + ", tail refreshes: " + str(self.tail_refreshes) + ", misses: " + str(self.misses)
+
+    #returns the (start, end) range already requested for key, or None if the key has never been requested
+    def coverage(self, key):
+        with self._lock:
+            return self._connection.execute("SELECT start, end FROM coverage WHERE project=? AND access=? AND agent=? AND article=? AND granularity=?",
+                                            key).fetchone()
+
+    #returns the cached items for key that a request over start-end would return, oldest first, in the same shape the API returns them.
+    #like the API, monthly data runs from the month start is in up to the last month starting before end, other data
+    #runs from start to end with both ends included
+    def items(self, key, start, end):
+        project, access, agent, article, granularity = key
+        if granularity == "monthly":
+            start, end_test = start[:6] + "0100", "timestamp < ?"
+        else:
+            end_test = "timestamp <= ?"
+        with self._lock:
+            rows = self._connection.execute("""SELECT timestamp, views FROM pageviews
+                WHERE project=? AND access=? AND agent=? AND article=? AND granularity=? AND timestamp >= ? AND """ + end_test + """
+                ORDER BY timestamp""", tuple(key) + (start, end)).fetchall()
+        return [dict(zip(ITEM_FIELDS, (project, article, granularity, timestamp, access, agent, views))) for timestamp, views in rows]
+
+    #stores the items returned by a request for key over start-end and widens the key's covered range to include it.
+    #a key only has one covered range, so if start-end doesn't touch it the covered range is replaced rather than widened,
+    #otherwise the months between the two would be claimed as covered without ever having been requested
+    def store(self, key, items, start, end):
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO pageviews VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                         [tuple(key) + (month["timestamp"], month["views"]) for month in items])
+            covered = self._connection.execute("SELECT start, end FROM coverage WHERE project=? AND access=? AND agent=? AND article=? AND granularity=?",
+                                               key).fetchone()
+            if covered is not None and start <= covered[1] and end >= covered[0]:
+                start, end = min(start, covered[0]), max(end, covered[1])
+            self._connection.execute("INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?, ?, ?)", tuple(key) + (start, end))
+
+    """
+    Answers a request for key over start-end from the cache, calling request_fn only for what is missing.
+    If the cached range already covers start-end nothing is requested. If it starts early enough but ends before end,
+    only the range from the cached end onwards is requested, so the last cached month is fetched again in case it was
+    still incomplete. That range starts at the cached end even when start is later, so a gap between the cached range
+    and start-end is filled in rather than left out of a covered range. Otherwise the whole range is requested, up to
+    at least the start of the cached range for the same reason.
+    returns a response in the same shape as the API, with "items" for start-end, or None if the request failed.
+    @param: key: a (project, access, agent, article, granularity) tuple, article with spaces replaced by "_"
+    @param: start a string of format YYYYMMDDSS for the start date of the search
+    @param: end: a string of format YYYYMMDDSS for the end date of the search
+    @param: request_fn: a function taking (start, end) strings and returning the API response for key over that range
+    """
+    def fetch(self, key, start, end, request_fn):
+        covered = self.coverage(key)
+        if covered is not None and covered[0] <= start and covered[1] >= end:
+            with self._lock:
+                self.hits += 1
+        else:
+            request_end = end
+            if covered is not None and covered[0] <= start:
+                request_start = covered[1]
+                counter = "tail_refreshes"
+            else:
+                request_start = start
+                if covered is not None:
+                    request_end = max(end, covered[0])
+                counter = "misses"
+            with self._lock:
+                setattr(self, counter, getattr(self, counter) + 1)
+            response = request_fn(request_start, request_end)
+            if response is None:
+                return None
+            if "items" in response:
+                self.store(key, response["items"], request_start, request_end)
+            elif is_not_found_response(response):
+                #only a response saying there is no data is safe to remember, anything else has to be asked for again next run
+                self.store(key, [], request_start, request_end)
+            else:
+                #an error we don't understand, don't remember it and hand it back as is
+                return response
+        items = self.items(key, start, end)
+        if not items:
+            return {"type": "not_found", "title": "Not found."}
+        return {"items": items}
@@ -0,0 +1,230 @@
+'''this file contains the HTTP client used by wikipedia_pageview_timeseries_generator to talk to the Pageviews API
+
+A single PageviewClient is shared by every worker thread. It keeps a pool of keep-alive connections open through
+one requests.Session instead of opening a new connection for every request, builds each request URL without
+touching any shared state, and retries requests that fail for reasons that are likely to go away (timeouts,
+dropped connections, 429 and 5xx responses) with exponential backoff and jitter, waiting at least as long as
+the API's Retry-After header asks. It also counts requests, retries, failures and the time spent waiting on the network,
+and can report every attempt to a PageviewTelemetry (see wikipedia_pageview_telemetry) for a fuller picture.
+'''
+import random, threading, time, urllib.parse
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from wikipedia_pageview_telemetry import status_category
+
+# Response codes worth trying again, anything else is returned to the caller as is
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# How many times a request is retried before giving up on it, and the limits of the wait between tries in seconds
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+# Seconds to wait for the API to respond before treating the request as failed
+REQUEST_TIMEOUT = 30.0
+# The YYYYMMDDHH format the API uses for the start and end of a request and for the timestamp of each item
+TIMESTAMP_FORMAT = "%Y%m%d%H"
+# Daily and hourly data is requested this many days at a time, so each response stays small and a failed request only
+# has to repeat one chunk. Monthly data is always requested in one go
+CHUNK_DAYS = {"daily": 366, "hourly": 31}
+
+#returns True if an API response says there is no data for the article, as opposed to a failed or rate limited request
+def is_not_found_response(response):
+    return str(response.get("type", "")).endswith("not_found") or response.get("title") == "Not found."
+
+"""
+Splits the date range start-end into consecutive ranges of at most chunk_days days that do not overlap.
+returns a list of (start, end) tuples of strings of format YYYYMMDDSS, covering start-end with both ends included.
+@param: start a string of format YYYYMMDDSS for the start date of the range
+@param: end: a string of format YYYYMMDDSS for the end date of the range
+@param: chunk_days: the most days to put in one range
+"""
+def split_date_range(start, end, chunk_days):
+    chunk_start = datetime.strptime(start, TIMESTAMP_FORMAT)
+    range_end = datetime.strptime(end, TIMESTAMP_FORMAT)
+    ranges = []
+    while chunk_start <= range_end:
+        chunk_end = min(range_end, chunk_start + timedelta(days=chunk_days) - timedelta(hours=1))
+        ranges.append((chunk_start.strftime(TIMESTAMP_FORMAT), chunk_end.strftime(TIMESTAMP_FORMAT)))
+        chunk_start = chunk_end + timedelta(hours=1)
+    return ranges
+
+#returns the number of seconds a Retry-After header asks us to wait, or 0 if there is no usable header.
+#the header can either be a number of seconds or an HTTP date
+def retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+#returns how long to wait before retry number attempt (starting at 0), exponential backoff with full jitter
+def backoff_seconds(attempt, base = BACKOFF_BASE, maximum = BACKOFF_MAX):
+    return random.uniform(0.0, min(maximum, base * (2 ** attempt)))
+
+"""
+A thread safe client for the per-article Pageviews API.
+@param: endpoint_url: the pageviews endpoint, e.g. https://wikimedia.org/api/rest_v1/metrics/pageviews/
+@param: endpoint_params: the format string for the per-article part of the URL
+@param: request_template: a dictionary of the values to fill endpoint_params with, it is never modified
+@param: headers: the headers sent with every request, including the User-Agent the API asks for
+@param: rate_limiter: an optional TokenBucketRateLimiter, a token is taken before every attempt including retries
+@param: pool_size: the number of keep-alive connections to keep open, should be at least the number of worker threads
+@param: max_retries: the number of times a failed request is tried again before giving up
+@param: timeout: the number of seconds to wait for a response
+@param: telemetry: an optional PageviewTelemetry told about every attempt, throttle wait and backoff
+"""
+class PageviewClient:
+    def __init__(self, endpoint_url, endpoint_params, request_template, headers,
+                 rate_limiter = None, pool_size = 16, max_retries = MAX_RETRIES, timeout = REQUEST_TIMEOUT, telemetry = None):
+        self.endpoint_url = endpoint_url
+        self.telemetry = telemetry
+        self.endpoint_params = endpoint_params
+        self.request_template = dict(request_template)
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.timeout = timeout
+        #requests is imported here rather than at the top so that importing this file, e.g. for the generator's
+        #constants in the analysis stage, doesn't pay for it
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def close(self):
+        self.session.close()
+
+    #returns the request URL for one article, access type and date range. The article title has spaces replaced with "_" and is URL encoded.
+    #granularity and project default to the ones in the request template
+    def build_url(self, article_title, access, start, end, granularity = None, project = None):
+        article_title_encoded = urllib.parse.quote(article_title.replace(' ','_'))
+        request_params = dict(self.request_template, article=article_title_encoded, access=access, start=start, end=end)
+        if granularity is not None:
+            request_params["granularity"] = granularity
+        if project is not None:
+            request_params["project"] = project
+        return self.endpoint_url + self.endpoint_params.format(**request_params)
+
+    #returns the counters kept by the client as a dictionary
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "latency_total": self.latency_total,
+                "latency_mean": self.latency_total / self.requests if self.requests else 0.0,
+                "latency_max": self.latency_max,
+            }
+
+    #returns a one line summary of the counters kept by the client
+    def report(self):
+        stats = self.stats()
+        return "requests: " + str(stats["requests"]) + ", retries: " + str(stats["retries"]) + ", failures: " + str(stats["failures"]) + \
+            ", mean latency: " + str(round(stats["latency_mean"] * 1000, 1)) + "ms, max latency: " + str(round(stats["latency_max"] * 1000, 1)) + "ms"
+
+    def _record(self, latency, retried = False, failed = False):
+        with self._lock:
+            self.requests += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.retries += retried
+            self.failures += failed
+
+    """
+    Requests url, retrying timeouts, connection errors and RETRY_STATUS_CODES responses up to max_retries times.
+    returns the decoded JSON response, or None if every try failed or the response was not JSON.
+    @param: url: the full request URL
+    @param: title: the article title the request is for, only used to label telemetry
+    """
+    def get_json(self, url, title = None):
+        import requests
+        telemetry = self.telemetry
+        for attempt in range(self.max_retries + 1):
+            throttle_wait = 0.0
+            if self.rate_limiter is not None:
+                throttle_wait = self.rate_limiter.acquire()
+            wait = 0.0
+            request_start = time.monotonic()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                response = None
+                error = e
+                outcome = "timeout" if isinstance(e, requests.Timeout) else "connection_error"
+            latency = time.monotonic() - request_start
+            if response is not None:
+                outcome = status_category(response.status_code)
+            if response is not None and response.status_code not in RETRY_STATUS_CODES:
+                self._record(latency)
+                try:
+                    decoded = response.json()
+                except ValueError as e:
+                    print(e)
+                    with self._lock:
+                        self.failures += 1
+                    if telemetry is not None:
+                        telemetry.record_attempt(title, latency, throttle_wait, "invalid_json")
+                        telemetry.record_failure(title, "invalid_json")
+                    return None
+                if telemetry is not None:
+                    telemetry.record_attempt(title, latency, throttle_wait, outcome)
+                return decoded
+            if telemetry is not None:
+                telemetry.record_attempt(title, latency, throttle_wait, outcome)
+            if response is not None:
+                error = "HTTP " + str(response.status_code)
+                wait = retry_after_seconds(response)
+            if attempt == self.max_retries:
+                self._record(latency, failed=True)
+                if telemetry is not None:
+                    telemetry.record_failure(title, outcome)
+                print(str(error) + " requesting " + url + ", giving up after " + str(attempt + 1) + " tries")
+                return None
+            self._record(latency, retried=True)
+            sleep_seconds = max(wait, backoff_seconds(attempt))
+            if telemetry is not None:
+                telemetry.record_backoff(title, sleep_seconds)
+            time.sleep(sleep_seconds)
+
+    """
+    Requests the pageviews of one article. Daily and hourly data is requested in chunks of CHUNK_DAYS days which are
+    joined back together, chunks the API has no data for (e.g. before the article existed) add nothing.
+    returns the decoded JSON response, or None if the request or any of its chunks failed.
+    @param: article_title: the article title, spaces are allowed
+    @param: access: the access type, e.g. "desktop"
+    @param: start a string of format YYYYMMDDSS for the start date of the search
+    @param: end: a string of format YYYYMMDDSS for the end date of the search
+    @param: granularity: "monthly", "daily" or "hourly", defaults to the one in the request template
+    @param: project: the wiki to ask about, e.g. "de.wikipedia.org", defaults to the one in the request template
+    """
+    def request_pageviews(self, article_title, access, start, end, granularity = None, project = None):
+        chunk_days = CHUNK_DAYS.get(granularity or self.request_template["granularity"])
+        if chunk_days is None:
+            return self.get_json(self.build_url(article_title, access, start, end, granularity, project), article_title)
+        items = []
+        response = None
+        for chunk_start, chunk_end in split_date_range(start, end, chunk_days):
+            response = self.get_json(self.build_url(article_title, access, chunk_start, chunk_end, granularity, project), article_title)
+            if response is None:
+                return None
+            if "items" in response:
+                items.extend(response["items"])
+            elif not is_not_found_response(response):
+                return response
+        if not items:
+            return response
+        return {"items": items}
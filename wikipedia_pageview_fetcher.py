@@ -0,0 +1,88 @@
+'''this file contains the concurrent fetch engine used by wikipedia_pageview_timeseries_generator
+
+The Pageviews API asks that we not exceed 100 requests per second. Making one blocking request at a time
+means the network round trip, not that cap, is what limits how fast we can go. Instead we keep several requests
+in flight on a thread pool and have every worker take a token from one shared token bucket before it sends
+anything, so the cap holds across all workers no matter how many there are.
+'''
+import threading, time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+"""
+A thread safe token bucket. Tokens refill continuously at `rate` per second up to `capacity`, and every request
+must take one token before it is sent. When the bucket is empty the caller reserves the next token and sleeps
+until it is due, so callers are served in the order they arrived and the rate is never exceeded.
+@param: rate: the number of requests per second allowed across every thread sharing this limiter
+@param: capacity: the largest burst allowed, defaults to 1 so requests are evenly spaced at 1/rate seconds
+"""
+class TokenBucketRateLimiter:
+    def __init__(self, rate, capacity = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be a positive number of requests per second")
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    #takes one token from the bucket, sleeping until one is available. Returns the number of seconds spent waiting.
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            #take the token now even if it puts the bucket in debt, the debt is what makes later callers wait longer
+            self._tokens -= 1.0
+            wait_seconds = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait_seconds > 0.0:
+            time.sleep(wait_seconds)
+        return wait_seconds
+
+# Marks the end of the keys in iter_concurrently, since None could itself be a key
+_NO_KEY = object()
+
+"""
+Calls request_fn once for every key in keys, keeping up to max_workers calls in flight at once, and yields each
+result as soon as it is ready. Keys are submitted in order a few at a time rather than all at once, so results come
+back roughly in the order of keys and memory use does not grow with the number of keys.
+Any rate limiting is left to request_fn, usually by sharing a TokenBucketRateLimiter between calls.
+yields a (key, result) tuple for every key, in the order the calls finish.
+@param: keys: an iterable of hashable values, each one is passed to request_fn on its own
+@param: request_fn: a function taking a single key and returning its result, it must be safe to call from many threads
+@param: max_workers: the number of threads to use, 1 or fewer runs every call serially on the calling thread
+"""
+def iter_concurrently(keys, request_fn, max_workers = 8):
+    if max_workers is None or max_workers <= 1:
+        for key in keys:
+            yield key, request_fn(key)
+        return
+    keys = iter(keys)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        #keep a few calls queued behind the running ones so workers never sit idle waiting for the next submit
+        pending = {}
+        for key in keys:
+            pending[executor.submit(request_fn, key)] = key
+            if len(pending) >= max_workers * 2:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = pending.pop(future)
+                next_key = next(keys, _NO_KEY)
+                if next_key is not _NO_KEY:
+                    pending[executor.submit(request_fn, next_key)] = next_key
+                yield key, future.result()
+
+"""
+Calls request_fn once for every key in keys, keeping up to max_workers calls in flight at once.
+Any rate limiting is left to request_fn, usually by sharing a TokenBucketRateLimiter between calls.
+returns a dictionary mapping each key to what request_fn returned for it, in the same order as keys.
+@param: keys: an iterable of hashable values, each one is passed to request_fn on its own
+@param: request_fn: a function taking a single key and returning its result, it must be safe to call from many threads
+@param: max_workers: the number of threads to use, 1 or fewer runs every call serially on the calling thread
+"""
+def fetch_concurrently(keys, request_fn, max_workers = 8):
+    keys = list(keys)
+    results = dict(iter_concurrently(keys, request_fn, max_workers))
+    #results come back in whatever order they finish, put them back in the order they were asked for
+    return {key: results[key] for key in keys}
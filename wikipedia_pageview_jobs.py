@@ -0,0 +1,222 @@
+'''this file runs many pageview jobs at once, each with its own article list, wiki, outputs and date range
+
+A job is what one run of wikipedia_pageview_timeseries_generator does: request the pageviews of a list of articles
+and write every output for each of them to a JSON Lines file. Jobs are read from a JSON manifest like
+    {"jobs": [
+        {"name": "dinosaurs", "titles_csv": "dinosaur_names_to_links_sept_2022.csv", "title_column": "name"},
+        {"name": "dinosaurs_de", "project": "de.wikipedia.org", "titles": ["Tyrannosaurus", "Stegosaurus"],
+         "outputs": ["desktop"], "start": "2020010100", "end": "2022100100", "output_path": "dinosaurs_de.jsonl"}
+    ]}
+where every field but name and the titles falls back to the generator's defaults (see PageviewJob).
+
+All the jobs are run by one process through one PageviewClient, so every request shares a single rate limit and
+worker pool and the API budget is spent on whichever job has work left instead of running one script per job.
+The same article on the same wiki is only requested once per access type and granularity however many jobs ask for
+it: the request covers the earliest start and the latest end of those jobs and each job gets the months in its own
+range, cut out of the longer series the same way the API would have cut it. Each job's file is written and
+resumed on its own, exactly like stream_monthly_pageviews.
+
+Run it with
+    python wikipedia_pageview_jobs.py manifest.json
+'''
+import argparse, contextlib, json, os
+from collections import namedtuple
+from wikipedia_pageview_fetcher import iter_concurrently
+from wikipedia_pageview_writer import JsonLinesWriter, completed_titles
+from wikipedia_pageview_cache import PageviewCache, PAGEVIEW_CACHE_PATH
+from wikipedia_pageview_telemetry import PageviewTelemetry, TELEMETRY_METRICS_PATH
+from wikipedia_pageview_timeseries_generator import (API_MAX_WORKERS, API_RATE_LIMIT, API_REQUEST_PAGEVIEWS_ENDPOINT,
+                                                     ARTICLE_PAGEVIEWS_PARAMS_TEMPLATE, DERIVE_ALL_ACCESS_LOCALLY, END_DATE,
+                                                     GRANULARITY, START_DATE, access_types_for_outputs, derive_outputs,
+                                                     has_failed_response, load_article_titles, make_client)
+
+"""
+One job of a manifest.
+@param: name: a name for the job, used for its default output path
+@param: titles: an array of string article titles
+@param: project: the wiki the titles are on, e.g. "en.wikipedia.org"
+@param: outputs: an array of output names to build, any of "mobile", "desktop" and "cumulative"
+@param: start a string of format YYYYMMDDSS for the start date of the search
+@param: end: a string of format YYYYMMDDSS for the end date of the search
+@param: granularity: "monthly" or "daily"
+@param: output_path: the path of the JSON Lines file the job writes
+@param: derive_all_access: if True build the cumulative output from desktop and mobile instead of requesting all-access
+"""
+PageviewJob = namedtuple("PageviewJob", ["name", "titles", "project", "outputs", "start", "end", "granularity",
+                                         "output_path", "derive_all_access"])
+
+#returns the path a job writes to when the manifest doesn't give one, named like the generator's STREAM_DATA_PATH
+def default_output_path(name, granularity, start, end):
+    return name + "_" + granularity + "_" + start[0:6] + "-" + end[0:6] + ".jsonl"
+
+"""
+Reads the jobs in a manifest file. Each job gives its titles either inline as "titles" or as a CSV file in "titles_csv",
+read from the column "title_column" ("name" by default).
+returns a list of PageviewJob in the order they appear in the manifest.
+@param: path: the path of the JSON manifest
+"""
+def load_manifest(path):
+    with open(path, encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+    jobs = []
+    for entry in manifest["jobs"]:
+        if "titles" in entry:
+            titles = list(entry["titles"])
+        else:
+            titles = load_article_titles(entry["titles_csv"], entry.get("title_column", "name"))
+        granularity = entry.get("granularity", GRANULARITY)
+        start, end = entry.get("start", START_DATE), entry.get("end", END_DATE)
+        jobs.append(PageviewJob(entry["name"], titles, entry.get("project", ARTICLE_PAGEVIEWS_PARAMS_TEMPLATE["project"]),
+                                list(entry.get("outputs", ["mobile", "desktop", "cumulative"])), start, end, granularity,
+                                entry.get("output_path") or default_output_path(entry["name"], granularity, start, end),
+                                entry.get("derive_all_access", DERIVE_ALL_ACCESS_LOCALLY)))
+    return jobs
+
+#returns the part of a response that a request for start-end would have returned, responses without items are returned as they are.
+#monthly requests return the months from the one start is in up to the last one that starts before end, daily and hourly
+#requests return every item from start to end with both ends included
+def _slice_response(response, start, end, granularity):
+    if response is None or "items" not in response:
+        return response
+    if granularity == "monthly":
+        items = [month for month in response["items"] if start[:6] + "0100" <= month["timestamp"] < end]
+    else:
+        items = [month for month in response["items"] if start <= month["timestamp"] <= end]
+    if not items:
+        return {"type": "not_found", "title": "Not found."}
+    return {"items": items}
+
+"""
+Runs every job in jobs together. The (project, article, access, granularity) requests all the jobs need are worked
+out up front with repeats removed, then sent through one client on max_workers threads. As soon as every access
+type one job needs for a title is back, that title's record is written to the job's file.
+returns a dictionary mapping each job name to the number of titles written for it by this call.
+@param: jobs: an array of PageviewJob, see load_manifest
+@param: max_workers: the number of requests allowed in flight at once, across all jobs
+@param: rate_limit: the maximum number of requests sent per second, across all jobs
+@param: endpoint_url: the pageviews endpoint to query, can be pointed at a local server for testing
+@param: cache: an optional PageviewCache, when given only the months it does not already hold are requested
+@param: client: an optional PageviewClient to send every request through, see request_pageviews_concurrently
+@param: resume: if False every job's file is emptied first and every title is requested
+"""
+def run_jobs(jobs, max_workers = API_MAX_WORKERS, rate_limit = API_RATE_LIMIT,
+             endpoint_url = API_REQUEST_PAGEVIEWS_ENDPOINT, cache = None, client = None, resume = True):
+    job_accesses = [access_types_for_outputs(job.outputs, job.derive_all_access) for job in jobs]
+    #the date range each request covers and the (job, title) pairs waiting on it, keyed by (project, article, access, granularity)
+    ranges = {}
+    waiting = {}
+    titles_by_key = {}
+    titles_to_write = 0
+    for job_index, job in enumerate(jobs):
+        if resume:
+            done = completed_titles(job.output_path)
+        else:
+            open(job.output_path, "w").close()
+            done = set()
+        for title in dict.fromkeys(job.titles):
+            if title in done:
+                continue
+            titles_to_write += 1
+            for access in job_accesses[job_index]:
+                key = (job.project, title.replace(' ','_'), access, job.granularity)
+                titles_by_key.setdefault(key, title)
+                start, end = ranges.get(key, (job.start, job.end))
+                ranges[key] = (min(start, job.start), max(end, job.end))
+                waiting.setdefault(key, []).append((job_index, title))
+
+    own_client = client is None
+    if own_client:
+        client = make_client(max_workers, rate_limit, endpoint_url)
+    agent = client.request_template["agent"]
+    def request_fn(key):
+        project, article, access, granularity = key
+        start, end = ranges[key]
+        def request_range(range_start, range_end):
+            return client.request_pageviews(titles_by_key[key], access, range_start, range_end, granularity, project)
+        if cache is None:
+            return request_range(start, end)
+        return cache.fetch((project, access, agent, article, granularity), start, end, request_range)
+
+    if client.telemetry is not None:
+        client.telemetry.start_progress(titles_to_write, "job titles")
+    #responses of the titles that still have requests in flight, one dictionary per job
+    in_flight = [{} for job in jobs]
+    try:
+        with contextlib.ExitStack() as stack:
+            writers = [stack.enter_context(JsonLinesWriter(job.output_path)) for job in jobs]
+            for key, response in iter_concurrently(list(ranges), request_fn, max_workers):
+                access = key[2]
+                for job_index, title in waiting.pop(key):
+                    job = jobs[job_index]
+                    title_responses = in_flight[job_index].setdefault(title, {})
+                    title_responses[(title, access)] = response if ranges[key] == (job.start, job.end) else _slice_response(response, job.start, job.end, job.granularity)
+                    if len(title_responses) == len(job_accesses[job_index]):
+                        del in_flight[job_index][title]
+                        results = derive_outputs(title_responses, [title], job.outputs, job.derive_all_access)
+                        writers[job_index].write(title, {output: results[output][title] for output in job.outputs},
+                                                 failed=has_failed_response(title_responses.values()))
+                        if client.telemetry is not None:
+                            client.telemetry.advance()
+        for job, writer in zip(jobs, writers):
+            if writer.records_failed:
+                print(job.name + ": " + str(writer.records_failed) + " titles had failed requests and will be requested again by the next run")
+        return {job.name: writer.records_written for job, writer in zip(jobs, writers)}
+    finally:
+        if own_client:
+            client.close()
+
+#returns how many requests the jobs need with and without repeats removed, counted before any are skipped by resuming
+def count_requests(jobs):
+    total = 0
+    unique = set()
+    for job in jobs:
+        accesses = access_types_for_outputs(job.outputs, job.derive_all_access)
+        titles = list(dict.fromkeys(job.titles))
+        total += len(titles) * len(accesses)
+        unique.update((job.project, title.replace(' ','_'), access, job.granularity) for title in titles for access in accesses)
+    return total, len(unique)
+
+#runs every job in a manifest from the command line, argv defaults to sys.argv[1:]
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Run every pageview job in a manifest through one shared rate limit")
+    parser.add_argument("manifest", help="the JSON manifest of jobs")
+    parser.add_argument("--max-workers", type=int, default=API_MAX_WORKERS)
+    parser.add_argument("--rate-limit", type=float, default=API_RATE_LIMIT)
+    parser.add_argument("--endpoint-url", default=API_REQUEST_PAGEVIEWS_ENDPOINT)
+    parser.add_argument("--cache", default=PAGEVIEW_CACHE_PATH, help="the response cache file, empty to not use one")
+    parser.add_argument("--no-resume", action="store_true", help="start every job's file again from scratch")
+    parser.add_argument("--no-stores", action="store_true", help="don't build a columnar store for each output of each job")
+    parser.add_argument("--metrics", default=TELEMETRY_METRICS_PATH, help="where to save the run's metrics as JSON, empty to not save them")
+    parser.add_argument("--prometheus", help="also save the run's metrics here in the Prometheus text format")
+    args = parser.parse_args(argv)
+    jobs = load_manifest(args.manifest)
+    total, unique = count_requests(jobs)
+    print(str(len(jobs)) + " jobs need " + str(total) + " requests, " + str(unique) + " once repeats are removed")
+    cache = PageviewCache(args.cache) if args.cache else None
+    telemetry = PageviewTelemetry()
+    client = make_client(args.max_workers, args.rate_limit, args.endpoint_url, telemetry)
+    try:
+        written = run_jobs(jobs, args.max_workers, cache=cache, client=client, resume=not args.no_resume)
+    finally:
+        client.close()
+        if cache is not None:
+            cache.close()
+        if args.metrics:
+            telemetry.write_json(args.metrics)
+        if args.prometheus:
+            telemetry.write_prometheus(args.prometheus)
+    for job in jobs:
+        print(job.name + ": " + str(written[job.name]) + " titles written to " + job.output_path)
+    if cache is not None:
+        print(cache.report())
+    print(client.report())
+    print(telemetry.report())
+    if not args.no_stores:
+        #numpy is only needed once the requests are done
+        from wikipedia_pageview_store import jsonl_to_store
+        for job in jobs:
+            for output in job.outputs:
+                jsonl_to_store(job.output_path, output, os.path.splitext(job.output_path)[0] + "_" + output, job.granularity, job.titles)
+
+if __name__ == "__main__":
+    main()
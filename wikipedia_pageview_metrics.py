@@ -0,0 +1,120 @@
+'''this file computes the per article metrics the charts in wikipedia_pageview_analysis are built from
+
+Every metric for every article of one access type is computed in a single vectorized pass over a PageviewMatrix
+(see wikipedia_pageview_store) instead of walking each article's list of monthly objects in Python. The matrix is
+read a block of rows at a time so memory use stays flat for very large article lists, even when it is memory mapped.
+Picking the top or bottom k articles by a metric partitions around the k-th value, so only the k chosen articles get sorted.
+'''
+import numpy as np
+from wikipedia_pageview_store import PageviewMatrix, matrix_from_timeseries
+
+# Percentiles computed for every article alongside the median
+DEFAULT_PERCENTILES = (25, 75, 90)
+# Number of matrix rows processed at once
+CHUNK_ROWS = 4096
+
+"""
+The metrics of every article of one access type, each an array with one value per article in the order of articles.
+Articles with no data have a count and total of 0, a mean and max of -1 (like the old per article calculators)
+and NaN for the median and percentiles.
+@param: matrix: the PageviewMatrix the metrics were computed from, used to look up each article's time series
+@param: count: the number of months with data
+@param: total: the sum of views over all months
+@param: mean: the average views per month with data
+@param: max: the highest views in a single month
+@param: median: the median views per month with data
+@param: percentiles: a dictionary mapping each percentile to an array of that percentile of views per month
+"""
+class PageviewMetrics:
+    def __init__(self, matrix, count, total, mean, max, median, percentiles):
+        self.matrix = matrix
+        self.articles = matrix.articles
+        self.count = count
+        self.total = total
+        self.mean = mean
+        self.max = max
+        self.median = median
+        self.percentiles = percentiles
+
+"""
+Computes every metric for every article in a PageviewMatrix in one pass.
+returns a PageviewMetrics.
+@param: matrix: a PageviewMatrix, or a dictionary of title to monthly objects like the ones load_data returns
+@param: percentiles: the percentiles to compute on top of the median
+@param: chunk_rows: the number of rows processed at once
+"""
+def compute_metrics(matrix, percentiles = DEFAULT_PERCENTILES, chunk_rows = CHUNK_ROWS):
+    if not isinstance(matrix, PageviewMatrix):
+        matrix = matrix_from_timeseries(matrix)
+    rows = len(matrix.articles)
+    count = np.zeros(rows, dtype=np.int64)
+    total = np.zeros(rows, dtype=np.int64)
+    highest = np.full(rows, -1, dtype=np.int64)
+    quantiles = np.full((1 + len(percentiles), rows), np.nan)
+    for first in range(0, rows, chunk_rows):
+        last = min(rows, first + chunk_rows)
+        mask = np.asarray(matrix.mask[first:last])
+        views = np.where(mask, np.asarray(matrix.views[first:last]), 0)
+        count[first:last] = mask.sum(axis=1)
+        total[first:last] = views.sum(axis=1)
+        if views.shape[1]:
+            highest[first:last] = np.where(mask, views, -1).max(axis=1)
+            quantiles[:, first:last] = _masked_percentiles(views, mask, count[first:last], [50] + list(percentiles))
+    mean = np.full(rows, -1.0)
+    np.divide(total, count, out=mean, where=count > 0)
+    return PageviewMetrics(matrix, count, total, mean, highest, quantiles[0],
+                           {percentile: quantiles[i + 1] for i, percentile in enumerate(percentiles)})
+
+#computes percentiles of the masked values of each row the same way np.percentile does (linear interpolation).
+#np.nanpercentile does this one row at a time, so instead every row is sorted with the missing values pushed to the end
+#and the values either side of each percentile's position are picked out for all rows at once
+def _masked_percentiles(views, mask, count, percentiles):
+    ordered = np.sort(np.where(mask, views, np.iinfo(np.int64).max), axis=1)
+    result = np.full((len(percentiles), len(views)), np.nan)
+    has_data = count > 0
+    ordered, last = ordered[has_data], count[has_data] - 1
+    for i, percentile in enumerate(percentiles):
+        position = last * (percentile / 100.0)
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, last)
+        low = np.take_along_axis(ordered, below[:, None], axis=1)[:, 0]
+        high = np.take_along_axis(ordered, above[:, None], axis=1)[:, 0]
+        result[i, has_data] = low + (high - low) * (position - below)
+    return result
+
+#computes the metrics for each access type once so every chart can share them, takes a dictionary of access type to matrix
+def compute_access_metrics(matrices, percentiles = DEFAULT_PERCENTILES):
+    return {access: compute_metrics(matrix, percentiles) for access, matrix in matrices.items()}
+
+"""
+Finds the indices of the k largest values, only looking at indices where valid is True.
+returns an array of at most k indices, largest value first. Equal values are returned in article order.
+@param: values: an array with one value per article
+@param: k: the number of indices to return
+@param: valid: an optional bool array, indices where it is False are never returned
+"""
+def top_k(values, k, valid = None):
+    return _select_k(np.asarray(values), k, valid, largest=True)
+
+"""
+Finds the indices of the k smallest values, only looking at indices where valid is True.
+returns an array of at most k indices, smallest value first. Equal values are returned in article order.
+@param: values: an array with one value per article
+@param: k: the number of indices to return
+@param: valid: an optional bool array, indices where it is False are never returned
+"""
+def bottom_k(values, k, valid = None):
+    return _select_k(np.asarray(values), k, valid, largest=False)
+
+def _select_k(values, k, valid, largest):
+    indices = np.arange(len(values)) if valid is None else np.flatnonzero(valid)
+    keys = -values[indices] if largest else values[indices]
+    if k < len(indices):
+        #partitioning finds the k-th value without sorting everything. Which of several values equal to it
+        #argpartition would pick is arbitrary, so take everything better than it and then the first of the equal ones
+        kth = np.partition(keys, k - 1)[k - 1]
+        better = np.flatnonzero(keys < kth)
+        equal = np.flatnonzero(keys == kth)[:k - len(better)]
+        chosen = np.sort(np.concatenate([better, equal]))
+        indices, keys = indices[chosen], keys[chosen]
+    return indices[np.argsort(keys, kind="stable")[:k]]
@@ -0,0 +1,198 @@
+'''this file contains a local stand in for the Wikimedia per-article pageviews endpoint
+
+It serves made up but repeatable monthly and daily series for any article, so the generator and the analysis stage
+can be run and timed without sending a single request to wikimedia.org. Each article's series is worked out from a
+hash of its title, some articles start part way through the range so the mobile merge has gaps to deal with, and
+all-access is always the sum of the other three access types just like the real API. It can also slow down and
+misbehave on purpose: every response can be delayed, a share of requests can fail with a 500 or be rate limited
+with a 429 and a Retry-After header, and some titles can be missing entirely, like Tuebingosaurus and Elemgasem.
+
+Run it on its own with
+    python wikipedia_pageview_simulator.py --port 8080 --latency 0.05
+and point the generator's endpoint_url at the URL it prints.
+'''
+import argparse, json, random, threading, time, urllib.parse, zlib
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Titles the real API can't find, the simulator leaves them out too
+DEFAULT_MISSING_TITLES = ("Tuebingosaurus", "Elemgasem")
+# The access types the simulator serves data for, all-access is the sum of these
+SIMULATED_ACCESS_TYPES = ("desktop", "mobile-web", "mobile-app")
+
+NOT_FOUND_BODY = json.dumps({"type": "https://mediawiki.org/wiki/HyperSwitch/errors/not_found", "title": "Not found.",
+                             "detail": "The date(s) you used are valid, but we either do not have data for those date(s), or the project you asked for is not loaded yet."}).encode()
+
+#returns n made up article titles, the same ones every time
+def synthetic_titles(n):
+    return ["Simulated dinosaur " + str(i) for i in range(n)]
+
+#returns the timestamps of the periods of the given granularity between start and end, like the API. Monthly periods
+#are the months that start before end, daily periods are the days from start to end with both ends included
+def _period_timestamps(granularity, start, end):
+    timestamps = []
+    if granularity == "monthly":
+        year, month = int(start[:4]), int(start[4:6])
+        timestamp = start[:6] + "0100"
+        while timestamp < end:
+            timestamps.append(timestamp)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+            timestamp = "%04d%02d0100" % (year, month)
+    else:
+        day = datetime.strptime(start[:8], "%Y%m%d")
+        last = datetime.strptime(end[:8], "%Y%m%d")
+        while day <= last:
+            timestamps.append(day.strftime("%Y%m%d00"))
+            day += timedelta(days=1)
+    return timestamps
+
+#returns the made up views of one article and access type for one period, the same every time it is asked for.
+#returns None before the article's first month of data
+def synthetic_views(article, access, timestamp, granularity):
+    seed = zlib.crc32(article.encode("utf-8"))
+    first_month = "%04d%02d" % (2015 + seed % 8, 1 + (seed >> 3) % 12) if seed % 5 == 0 else "000000"
+    if timestamp[:6] < first_month:
+        return None
+    if access == "all-access":
+        views = [synthetic_views(article, other, timestamp, granularity) for other in SIMULATED_ACCESS_TYPES]
+        return sum(view for view in views if view is not None)
+    popularity = 1 + (seed >> 7) % 5000
+    share = {"desktop": 0.5, "mobile-web": 0.45, "mobile-app": 0.05}[access]
+    noise = zlib.crc32((article + access + timestamp).encode("utf-8")) % 1000 / 1000.0
+    views = popularity * share * (0.5 + noise)
+    if granularity == "daily":
+        views = views / 30.0
+    return int(views)
+
+"""
+Handles one request. The settings it follows live on the server, see PageviewSimulator.
+"""
+class _SimulatorHandler(BaseHTTPRequestHandler):
+    #keep connections open between requests so clients can pool them like they would with the real API
+    protocol_version = "HTTP/1.1"
+    #headers and body are written separately, without this every response on a kept open connection waits ~40ms for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers = ()):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        simulator = self.server.simulator
+        simulator.count_request()
+        if simulator.latency > 0.0 or simulator.latency_jitter > 0.0:
+            time.sleep(simulator.latency + random.uniform(0.0, simulator.latency_jitter))
+        roll = random.random()
+        if roll < simulator.rate_limited_rate:
+            self._send(429, b'{"title": "Too many requests"}', [("Retry-After", str(simulator.retry_after))])
+            return
+        if roll < simulator.rate_limited_rate + simulator.error_rate:
+            self._send(500, b'{"title": "Internal server error"}')
+            return
+        parts = self.path.split("?")[0].split("/")
+        if "per-article" not in parts or len(parts) < parts.index("per-article") + 8:
+            self._send(400, b'{"title": "Bad request"}')
+            return
+        project, access, agent, article, granularity, start, end = parts[parts.index("per-article") + 1:parts.index("per-article") + 8]
+        article = urllib.parse.unquote(article)
+        items = []
+        if not simulator.is_missing(article):
+            for timestamp in _period_timestamps(granularity, start, end):
+                views = synthetic_views(article, access, timestamp, granularity)
+                if views is not None:
+                    items.append({"project": project, "article": article, "granularity": granularity, "timestamp": timestamp,
+                                  "access": access, "agent": agent, "views": views})
+        if not items:
+            self._send(404, NOT_FOUND_BODY)
+            return
+        self._send(200, json.dumps({"items": items}).encode())
+
+class _SimulatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+"""
+A local HTTP server that behaves like the per-article pageviews endpoint. Use it as a context manager, or call
+start and stop, and send requests to its url.
+@param: port: the port to listen on, 0 picks a free one
+@param: latency: the number of seconds every response is delayed by
+@param: latency_jitter: up to this many more seconds are added to each delay at random
+@param: error_rate: the share of requests, from 0 to 1, that fail with a 500
+@param: rate_limited_rate: the share of requests, from 0 to 1, that are turned away with a 429
+@param: retry_after: the number of seconds the Retry-After header of a 429 asks for
+@param: missing_titles: titles the simulator has no data for
+@param: missing_rate: the share of all other titles, from 0 to 1, that have no data either
+"""
+class PageviewSimulator:
+    def __init__(self, port = 0, latency = 0.0, latency_jitter = 0.0, error_rate = 0.0, rate_limited_rate = 0.0,
+                 retry_after = 1, missing_titles = DEFAULT_MISSING_TITLES, missing_rate = 0.0):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.rate_limited_rate = rate_limited_rate
+        self.retry_after = retry_after
+        self.missing_titles = {title.replace(" ", "_") for title in missing_titles}
+        self.missing_rate = missing_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = _SimulatorServer(("127.0.0.1", port), _SimulatorHandler)
+        self._server.simulator = self
+        self._thread = None
+
+    #the endpoint URL to use in place of API_REQUEST_PAGEVIEWS_ENDPOINT
+    @property
+    def url(self):
+        return "http://127.0.0.1:" + str(self._server.server_address[1]) + "/api/rest_v1/metrics/pageviews/"
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    #returns True if the simulator has no data for article, the same answer every time
+    def is_missing(self, article):
+        if article.replace(" ", "_") in self.missing_titles:
+            return True
+        return zlib.crc32(("missing" + article).encode("utf-8")) % 10000 < self.missing_rate * 10000
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local imitation of the per-article pageviews endpoint")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds every response is delayed by")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="up to this many more seconds added at random")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests that fail with a 500")
+    parser.add_argument("--rate-limited-rate", type=float, default=0.0, help="share of requests turned away with a 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="seconds the Retry-After header of a 429 asks for")
+    parser.add_argument("--missing-rate", type=float, default=0.0, help="share of titles with no data")
+    args = parser.parse_args()
+    simulator = PageviewSimulator(args.port, args.latency, args.latency_jitter, args.error_rate, args.rate_limited_rate,
+                                  args.retry_after, missing_rate=args.missing_rate)
+    print("Serving simulated pageviews at " + simulator.url)
+    simulator.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        simulator.stop()
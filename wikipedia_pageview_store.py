@@ -0,0 +1,210 @@
+'''this file contains the columnar store the analysis stage reads pageviews from
+
+One output of the generator (e.g. all the mobile pageviews) is stored as a matrix with one row per article and one
+column per month. It is kept in three files next to each other:
+    <base>.views.npy   a dense int64 array of views, 0 where there is no data
+    <base>.mask.npy    a bool array of the same shape, True where the API returned a value for that month
+    <base>.index.json  the article titles in row order, the timestamps in column order and the granularity
+The .npy files are memory mapped when loaded, so loading costs almost nothing no matter how many articles there are
+and only the parts of the matrix that are actually used are read from disk.
+
+The columns don't have to be months. Daily data is stored the same way, one column per day, and resample_matrix
+sums it into weekly or monthly columns locally so one daily fetch is enough for every coarser view.
+'''
+import json
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+import numpy as np
+from wikipedia_pageview_writer import read_records
+
+# Granularities from finest to coarsest, data can only be resampled to a granularity later in this list
+GRANULARITIES = ["hourly", "daily", "weekly", "monthly"]
+# The granularities that can be resampled. Weeks cross month boundaries, so weekly data can't be summed into months
+RESAMPLEABLE_GRANULARITIES = ["hourly", "daily"]
+# The length of one column of each resampleable granularity
+GRANULARITY_STEPS = {"hourly": timedelta(hours=1), "daily": timedelta(days=1)}
+
+#returns the paths of the views, mask and index files of the store at base_path
+def store_paths(base_path):
+    return base_path + ".views.npy", base_path + ".mask.npy", base_path + ".index.json"
+
+"""
+A matrix of pageviews with one row per article and one column per timestamp.
+It can also be used like the dictionaries load_data returns, mapping each article to its list of monthly
+{"timestamp": ..., "views": ...} objects, with the list built from the matrix only when it is asked for.
+@param: articles: an array of article titles, one per row
+@param: timestamps: an array of timestamp strings of format YYYYMMDDSS, one per column, oldest first
+@param: views: an int64 array of shape (len(articles), len(timestamps))
+@param: mask: a bool array of the same shape, True where views holds a value returned by the API
+@param: granularity: the period each column covers, one of GRANULARITIES
+"""
+class PageviewMatrix(Mapping):
+    def __init__(self, articles, timestamps, views, mask, granularity = "monthly"):
+        self.articles = list(articles)
+        self.timestamps = list(timestamps)
+        self.views = views
+        self.mask = mask
+        self.granularity = granularity
+        self.row_of = {article: row for row, article in enumerate(self.articles)}
+
+    def __getitem__(self, article):
+        row = self.row_of[article]
+        columns = np.flatnonzero(self.mask[row])
+        views = self.views[row]
+        return [{"timestamp": self.timestamps[column], "views": int(views[column])} for column in columns]
+
+    def __iter__(self):
+        return iter(self.articles)
+
+    def __len__(self):
+        return len(self.articles)
+
+"""
+Builds a PageviewMatrix in memory from a dictionary mapping each title to its list of monthly JSON objects, as
+returned by the generator or load_data. Titles with no data get a row with nothing set in the mask.
+@param: series_by_title: a dictionary of title to list of monthly objects, each with "timestamp" and "views"
+@param: granularity: the period each item covers
+"""
+def matrix_from_timeseries(series_by_title, granularity = "monthly"):
+    timestamps = sorted({month["timestamp"] for series in series_by_title.values() for month in series})
+    column_of = {timestamp: column for column, timestamp in enumerate(timestamps)}
+    views = np.zeros((len(series_by_title), len(timestamps)), dtype=np.int64)
+    mask = np.zeros(views.shape, dtype=bool)
+    for row, series in enumerate(series_by_title.values()):
+        for month in series:
+            views[row, column_of[month["timestamp"]]] = month["views"]
+            mask[row, column_of[month["timestamp"]]] = True
+    return PageviewMatrix(series_by_title.keys(), timestamps, views, mask, granularity)
+
+#writes the index file of a store, the views and mask files are written by the caller
+def _write_index(base_path, articles, timestamps, granularity):
+    with open(store_paths(base_path)[2], "w") as index_file:
+        json.dump({"articles": list(articles), "timestamps": list(timestamps), "granularity": granularity}, index_file)
+
+#writes a PageviewMatrix to the store at base_path, replacing any store already there
+def write_store(base_path, matrix):
+    views_path, mask_path, _ = store_paths(base_path)
+    np.save(views_path, np.asarray(matrix.views, dtype=np.int64))
+    np.save(mask_path, np.asarray(matrix.mask, dtype=bool))
+    _write_index(base_path, matrix.articles, matrix.timestamps, matrix.granularity)
+
+"""
+Loads the store at base_path.
+returns a PageviewMatrix whose views and mask are memory mapped read only, unless mmap is False.
+@param: base_path: the path of the store without the .views.npy, .mask.npy or .index.json ending
+@param: mmap: if False the arrays are read fully into memory instead
+"""
+def load_store(base_path, mmap = True):
+    views_path, mask_path, index_path = store_paths(base_path)
+    with open(index_path) as index_file:
+        index = json.load(index_file)
+    mmap_mode = "r" if mmap else None
+    return PageviewMatrix(index["articles"], index["timestamps"], np.load(views_path, mmap_mode=mmap_mode), np.load(mask_path, mmap_mode=mmap_mode),
+                          index.get("granularity", "monthly"))
+
+"""
+Writes one output of a JSON Lines file from wikipedia_pageview_writer straight into a store, without building the
+dictionary of every title in memory. The file is read twice, once to find the rows and columns and once to fill them
+into arrays that are memory mapped onto the store's files. If a title appears more than once the last record wins.
+Titles are written to the file in whatever order their requests finish, so pass titles to get the same row order on
+every run. top_k and bottom_k break ties by row order, so without it the charts can pick different articles from the same data.
+returns the number of articles written.
+@param: jsonl_path: the path of the JSON Lines file
+@param: output: the output to store, e.g. "mobile"
+@param: base_path: the path of the store to write, without the file endings
+@param: granularity: the granularity the data in the file was requested at
+@param: titles: an optional array of titles giving the order of the rows, titles not in the file are left out.
+        Without it the rows are in the order the titles first appear in the file
+"""
+def jsonl_to_store(jsonl_path, output, base_path, granularity = "monthly", titles = None):
+    row_of = {}
+    timestamps = set()
+    for title, record in read_records(jsonl_path):
+        row_of.setdefault(title, len(row_of))
+        timestamps.update(month["timestamp"] for month in record[output])
+    if titles is not None:
+        row_of = {title: row for row, title in enumerate(title for title in dict.fromkeys(titles) if title in row_of)}
+    timestamps = sorted(timestamps)
+    column_of = {timestamp: column for column, timestamp in enumerate(timestamps)}
+    views_path, mask_path, _ = store_paths(base_path)
+    views = np.lib.format.open_memmap(views_path, mode="w+", dtype=np.int64, shape=(len(row_of), len(timestamps)))
+    mask = np.lib.format.open_memmap(mask_path, mode="w+", dtype=bool, shape=(len(row_of), len(timestamps)))
+    #each row is filled in memory and then written to the memory mapped arrays in one go, writing them a value at a time is slow
+    row_views = np.zeros(len(timestamps), dtype=np.int64)
+    row_mask = np.zeros(len(timestamps), dtype=bool)
+    for title, record in read_records(jsonl_path):
+        if title not in row_of:
+            continue
+        row_views[:] = 0
+        row_mask[:] = False
+        columns = [column_of[month["timestamp"]] for month in record[output]]
+        row_views[columns] = [month["views"] for month in record[output]]
+        row_mask[columns] = True
+        views[row_of[title]] = row_views
+        mask[row_of[title]] = row_mask
+    views.flush()
+    mask.flush()
+    del views, mask
+    _write_index(base_path, row_of, timestamps, granularity)
+    return len(row_of)
+
+#returns the timestamp of the start of the period of the given granularity that timestamp falls in.
+#weeks start on Monday
+def period_start(timestamp, granularity):
+    if granularity == "monthly":
+        return timestamp[:6] + "0100"
+    if granularity == "weekly":
+        day = datetime.strptime(timestamp[:8], "%Y%m%d")
+        return (day - timedelta(days=day.weekday())).strftime("%Y%m%d") + "00"
+    if granularity == "daily":
+        return timestamp[:8] + "00"
+    return timestamp
+
+#returns the indices of the periods in labels (one per column, in time order) that the columns from first to last
+#only cover part of, i.e. the first period if first is not its start and the last period if it goes on after last
+def _partial_periods(labels, boundaries, first, last, source_granularity, granularity):
+    partial = set()
+    if labels[0] != first:
+        partial.add(0)
+    following = (datetime.strptime(last, "%Y%m%d%H") + GRANULARITY_STEPS[source_granularity]).strftime("%Y%m%d%H")
+    if period_start(following, granularity) == labels[-1]:
+        partial.add(len(boundaries) - 1)
+    return partial
+
+"""
+Sums the columns of a matrix into coarser periods, e.g. daily data into weekly or monthly data. Because the columns
+are in time order the columns of each period sit next to each other, so every period of every row is summed at
+once with np.add.reduceat. A period has data if any of its columns had data. Rows are processed in blocks so
+memory mapped matrices are never read into memory all at once. This is for views per period like the mobile and
+desktop outputs, the running totals in the cumulative output can't be summed this way.
+Only hourly and daily data can be resampled, a week that crosses into a new month can't be split between the two.
+A period at either end of the matrix that its columns only cover part of, like the single day of October at the
+end of a daily run up to 2022100100, isn't a whole month (or week) of views, so it is left out unless drop_partial is False.
+returns a new PageviewMatrix held in memory.
+@param: matrix: the PageviewMatrix to resample
+@param: granularity: the granularity to resample to, coarser than the matrix's own
+@param: chunk_rows: the number of rows processed at once
+@param: drop_partial: if False periods only partly covered by the matrix are kept
+"""
+def resample_matrix(matrix, granularity, chunk_rows = 4096, drop_partial = True):
+    if matrix.granularity not in RESAMPLEABLE_GRANULARITIES or GRANULARITIES.index(granularity) < GRANULARITIES.index(matrix.granularity):
+        raise ValueError("can't resample " + matrix.granularity + " data to " + granularity)
+    labels = [period_start(timestamp, granularity) for timestamp in matrix.timestamps]
+    boundaries = [column for column in range(len(labels)) if column == 0 or labels[column] != labels[column - 1]]
+    timestamps = [labels[column] for column in boundaries]
+    keep = list(range(len(boundaries)))
+    if drop_partial and boundaries:
+        partial = _partial_periods(labels, boundaries, matrix.timestamps[0], matrix.timestamps[-1], matrix.granularity, granularity)
+        keep = [period for period in keep if period not in partial]
+    views = np.zeros((len(matrix.articles), len(timestamps)), dtype=np.int64)
+    mask = np.zeros(views.shape, dtype=bool)
+    if boundaries:
+        for first in range(0, len(matrix.articles), chunk_rows):
+            last = min(len(matrix.articles), first + chunk_rows)
+            block_mask = np.asarray(matrix.mask[first:last])
+            views[first:last] = np.add.reduceat(np.where(block_mask, np.asarray(matrix.views[first:last]), 0), boundaries, axis=1)
+            mask[first:last] = np.logical_or.reduceat(block_mask, boundaries, axis=1)
+    if len(keep) != len(timestamps):
+        timestamps = [timestamps[period] for period in keep]
+        views, mask = views[:, keep], mask[:, keep]
+    return PageviewMatrix(matrix.articles, timestamps, views, mask, granularity)
@@ -0,0 +1,252 @@
+'''this file contains the run telemetry of wikipedia_pageview_timeseries_generator and wikipedia_pageview_jobs
+
+A PageviewTelemetry is handed to the PageviewClient and is told about every attempt the client makes: how long the
+request spent on the network, how long it waited for the rate limiter's token beforehand, how long it slept backing
+off before a retry and how it turned out. From that it keeps
+    a latency histogram, with the same buckets exported to Prometheus
+    the requests per second since the run started
+    the time spent waiting on the network against the time spent throttled or backing off
+    how many attempts ended each way (ok, not_found, http_429, http_503, timeout, ...) and why requests gave up
+    the time spent on each title, so the slowest titles can be listed at the end
+The generator loops tell it as each title (or title and access type) is done, and it prints a progress line with an
+ETA every few seconds. At the end of a run summary() has all of this as a dictionary, which write_json saves as the
+run's metrics file and write_prometheus saves in the Prometheus text format for a node exporter textfile collector.
+Times summed over requests are summed over every worker thread, so with many workers they add up to more than the wall time.
+'''
+import bisect, heapq, json, threading, time
+
+# Default location of the metrics file, relative to where the generator is run from
+TELEMETRY_METRICS_PATH = "pageview_run_metrics.json"
+# Upper bounds in seconds of the buckets of the latency histogram
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Seconds between progress lines
+PROGRESS_INTERVAL = 10.0
+# Number of titles listed in the summary's slowest titles
+SLOWEST_TITLES = 10
+
+#returns the outcome category of one attempt from its HTTP status code, None meaning no response came back
+def status_category(status_code):
+    if status_code == 200:
+        return "ok"
+    if status_code == 404:
+        return "not_found"
+    return "http_" + str(status_code)
+
+#formats a number of seconds like 1h02m05s, 3m20s or 42s
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, minutes, seconds = seconds // 3600, seconds // 60 % 60, seconds % 60
+    if hours:
+        return "%dh%02dm%02ds" % (hours, minutes, seconds)
+    if minutes:
+        return "%dm%02ds" % (minutes, seconds)
+    return "%ds" % seconds
+
+"""
+Collects the telemetry of one run. Every method is thread safe.
+@param: progress_interval: the number of seconds between progress lines, 0 or less prints none
+@param: buckets: the upper bounds in seconds of the latency histogram's buckets, in increasing order
+@param: clock: the function used to tell the time, time.monotonic by default
+"""
+class PageviewTelemetry:
+    def __init__(self, progress_interval = PROGRESS_INTERVAL, buckets = LATENCY_BUCKETS, clock = time.monotonic):
+        self.progress_interval = progress_interval
+        self.buckets = tuple(buckets)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.started = clock()
+        #one count per bucket plus one for latencies above the last bucket
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.requests = 0
+        self.network_seconds = 0.0
+        self.latency_max = 0.0
+        self.throttle_seconds = 0.0
+        self.backoff_seconds = 0.0
+        self.outcomes = {}
+        self.failures = {}
+        self.failed_titles = {}
+        #seconds spent on the network, throttled and backing off for each title, and the number of attempts made for it
+        self.title_seconds = {}
+        self.title_requests = {}
+        self.done = 0
+        self.total = None
+        self.unit = "titles"
+        self._last_progress = self.started
+
+    #adds seconds to the time of title, the caller holds the lock
+    def _add_title_seconds(self, title, seconds):
+        if title is not None:
+            self.title_seconds[title] = self.title_seconds.get(title, 0.0) + seconds
+
+    """
+    Records one attempt at a request.
+    @param: title: the article title the request was for, None if unknown
+    @param: latency: the number of seconds spent waiting for the response
+    @param: throttle_wait: the number of seconds spent waiting for a token from the rate limiter before sending it
+    @param: outcome: how the attempt turned out, e.g. "ok", "not_found", "http_429" or "timeout"
+    """
+    def record_attempt(self, title, latency, throttle_wait, outcome):
+        with self._lock:
+            self.requests += 1
+            self.bucket_counts[bisect.bisect_left(self.buckets, latency)] += 1
+            self.network_seconds += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.throttle_seconds += throttle_wait
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            self._add_title_seconds(title, latency + throttle_wait)
+            if title is not None:
+                self.title_requests[title] = self.title_requests.get(title, 0) + 1
+
+    #records seconds spent sleeping before retrying a request for title
+    def record_backoff(self, title, seconds):
+        with self._lock:
+            self.backoff_seconds += seconds
+            self._add_title_seconds(title, seconds)
+
+    #records a request for title that was given up on, category being the outcome of its last attempt
+    def record_failure(self, title, category):
+        with self._lock:
+            self.failures[category] = self.failures.get(category, 0) + 1
+            if title is not None:
+                self.failed_titles.setdefault(title, category)
+
+    #starts counting progress towards total units of work, e.g. the number of titles still to be written
+    def start_progress(self, total, unit = "titles"):
+        with self._lock:
+            self.total = total
+            self.unit = unit
+            self.done = 0
+
+    #marks count more units of work as done and prints a progress line if the last one was long enough ago
+    def advance(self, count = 1):
+        with self._lock:
+            self.done += count
+            now = self._clock()
+            if self.progress_interval <= 0 or now - self._last_progress < self.progress_interval:
+                return
+            self._last_progress = now
+            line = self._progress_line(now)
+        print(line)
+
+    #returns a one line progress report, the caller holds the lock
+    def _progress_line(self, now):
+        elapsed = max(now - self.started, 1e-9)
+        line = "progress: " + str(self.done)
+        if self.total:
+            line += "/" + str(self.total) + " " + self.unit + " (" + str(round(100.0 * self.done / self.total, 1)) + "%)"
+        else:
+            line += " " + self.unit
+        line += ", " + str(round(self.done / elapsed, 1)) + " " + self.unit + "/s, " + str(round(self.requests / elapsed, 1)) + " requests/s"
+        if self.total and self.done:
+            line += ", ETA " + format_duration((self.total - self.done) * elapsed / self.done)
+        return line
+
+    #returns a one line progress report
+    def progress(self):
+        with self._lock:
+            return self._progress_line(self._clock())
+
+    #returns an estimate of the q-th quantile (0 to 1) of the latencies from the histogram, interpolating inside the
+    #bucket it falls in like Prometheus' histogram_quantile. Latencies above the last bucket are reported as the max seen
+    def latency_quantile(self, q):
+        with self._lock:
+            counts = list(self.bucket_counts)
+            latency_max = self.latency_max
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= rank:
+                if i == len(self.buckets):
+                    return latency_max
+                lower = self.buckets[i - 1] if i else 0.0
+                return min(latency_max, lower + (self.buckets[i] - lower) * (rank - seen) / count)
+            seen += count
+        return latency_max
+
+    """
+    Summarises the run so far.
+    returns a dictionary that can be saved as JSON, see write_json.
+    @param: slowest: the number of slowest titles to list
+    """
+    def summary(self, slowest = SLOWEST_TITLES):
+        quantiles = {"p50": self.latency_quantile(0.5), "p90": self.latency_quantile(0.9), "p99": self.latency_quantile(0.99)}
+        with self._lock:
+            wall_seconds = self._clock() - self.started
+            cumulative = 0
+            histogram = {}
+            for bound, count in zip([str(bound) for bound in self.buckets] + ["+Inf"], self.bucket_counts):
+                cumulative += count
+                histogram[bound] = cumulative
+            slowest_titles = heapq.nlargest(slowest, self.title_seconds.items(), key=lambda item: item[1])
+            return {
+                "wall_seconds": wall_seconds,
+                "requests": self.requests,
+                "requests_per_second": self.requests / wall_seconds if wall_seconds > 0 else 0.0,
+                "latency": dict(quantiles, mean=self.network_seconds / self.requests if self.requests else 0.0,
+                                max=self.latency_max, histogram=histogram),
+                "time": {"network_seconds": self.network_seconds, "throttle_seconds": self.throttle_seconds,
+                         "backoff_seconds": self.backoff_seconds},
+                "outcomes": dict(self.outcomes),
+                "failures": dict(self.failures),
+                "failed_titles": dict(self.failed_titles),
+                "slowest_titles": [{"title": title, "seconds": seconds, "requests": self.title_requests.get(title, 0)}
+                                   for title, seconds in slowest_titles],
+                "progress": {"done": self.done, "total": self.total, "unit": self.unit},
+            }
+
+    #returns a short human readable run summary, several lines long
+    def report(self, slowest = 5):
+        summary = self.summary(slowest)
+        time_spent = summary["time"]
+        lines = ["run took " + format_duration(summary["wall_seconds"]) + ", " + str(summary["requests"]) + " requests at " +
+                 str(round(summary["requests_per_second"], 1)) + " requests/s",
+                 "latency p50 " + str(round(summary["latency"]["p50"] * 1000, 1)) + "ms, p90 " + str(round(summary["latency"]["p90"] * 1000, 1)) +
+                 "ms, p99 " + str(round(summary["latency"]["p99"] * 1000, 1)) + "ms, max " + str(round(summary["latency"]["max"] * 1000, 1)) + "ms",
+                 "time on the network " + str(round(time_spent["network_seconds"], 1)) + "s, throttled " + str(round(time_spent["throttle_seconds"], 1)) +
+                 "s, backing off " + str(round(time_spent["backoff_seconds"], 1)) + "s (summed over workers)",
+                 "outcomes: " + ", ".join(outcome + " " + str(count) for outcome, count in sorted(summary["outcomes"].items()))]
+        if summary["failures"]:
+            lines.append("gave up: " + ", ".join(category + " " + str(count) for category, count in sorted(summary["failures"].items())))
+        if summary["slowest_titles"]:
+            lines.append("slowest titles: " + ", ".join(item["title"] + " " + str(round(item["seconds"], 2)) + "s" for item in summary["slowest_titles"]))
+        return "\n".join(lines)
+
+    #saves summary() to path as JSON
+    def write_json(self, path = TELEMETRY_METRICS_PATH):
+        with open(path, "w") as metrics_file:
+            json.dump(self.summary(), metrics_file, indent=4)
+
+    #returns the metrics in the Prometheus text exposition format, every name starting with prefix
+    def prometheus_text(self, prefix = "pageview_"):
+        summary = self.summary(0)
+        lines = ["# HELP " + prefix + "request_duration_seconds Time spent waiting for each response.",
+                 "# TYPE " + prefix + "request_duration_seconds histogram"]
+        for bound, count in summary["latency"]["histogram"].items():
+            lines.append(prefix + 'request_duration_seconds_bucket{le="' + bound + '"} ' + str(count))
+        lines.append(prefix + "request_duration_seconds_sum " + repr(summary["time"]["network_seconds"]))
+        lines.append(prefix + "request_duration_seconds_count " + str(summary["requests"]))
+        lines += ["# HELP " + prefix + "requests_total Attempts made, by how they turned out.", "# TYPE " + prefix + "requests_total counter"]
+        for outcome, count in sorted(summary["outcomes"].items()):
+            lines.append(prefix + 'requests_total{outcome="' + outcome + '"} ' + str(count))
+        lines += ["# HELP " + prefix + "failures_total Requests given up on, by the outcome of their last attempt.",
+                  "# TYPE " + prefix + "failures_total counter"]
+        for category, count in sorted(summary["failures"].items()):
+            lines.append(prefix + 'failures_total{category="' + category + '"} ' + str(count))
+        for name, help_text in [("throttle_seconds", "Time spent waiting for the rate limiter, summed over workers."),
+                                ("backoff_seconds", "Time spent sleeping before retries, summed over workers.")]:
+            lines += ["# HELP " + prefix + name + "_total " + help_text, "# TYPE " + prefix + name + "_total counter",
+                      prefix + name + "_total " + repr(summary["time"][name])]
+        lines += ["# HELP " + prefix + "progress_done Units of work done.", "# TYPE " + prefix + "progress_done gauge",
+                  prefix + "progress_done " + str(summary["progress"]["done"])]
+        if summary["progress"]["total"] is not None:
+            lines += ["# HELP " + prefix + "progress_total Units of work in the run.", "# TYPE " + prefix + "progress_total gauge",
+                      prefix + "progress_total " + str(summary["progress"]["total"])]
+        return "\n".join(lines) + "\n"
+
+    #saves prometheus_text() to path
+    def write_prometheus(self, path):
+        with open(path, "w") as prometheus_file:
+            prometheus_file.write(self.prometheus_text())
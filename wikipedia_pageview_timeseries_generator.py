@@ -1,5 +1,11 @@
-import json, time, urllib.parse, requests
-import pandas as pd
+import argparse, csv, json
+from collections import namedtuple
+from wikipedia_pageview_fetcher import TokenBucketRateLimiter, fetch_concurrently, iter_concurrently
+from wikipedia_pageview_client import PageviewClient, is_not_found_response
+from wikipedia_pageview_writer import JsonLinesWriter, completed_titles, jsonl_to_legacy_json
+from wikipedia_pageview_cache import PageviewCache, PAGEVIEW_CACHE_PATH
+from wikipedia_pageview_telemetry import PageviewTelemetry, TELEMETRY_METRICS_PATH
+from wikipedia_pageview_aggregates import PageviewAggregates, AGGREGATES_PATH
 
 
 
@@ -11,9 +17,12 @@ API_REQUEST_PAGEVIEWS_ENDPOINT = 'https://wikimedia.org/api/rest_v1/metrics/page
 # replace each parameter with an appropriate value before making the request
 API_REQUEST_PER_ARTICLE_PARAMS = 'per-article/{project}/{access}/{agent}/{article}/{granularity}/{start}/{end}'
 
-# The Pageviews API asks that we not exceed 100 requests per second, we add a small delay to each request
-API_LATENCY_ASSUMED = 0.002       # Assuming roughly 2ms latency on the API and network
-API_THROTTLE_WAIT = (1.0/100.0)-API_LATENCY_ASSUMED
+# The Pageviews API asks that we not exceed 100 requests per second. Several requests can be in flight at once so a
+# fixed sleep before each one no longer works, instead every request takes a token from a bucket shared by all
+# workers which refills at API_RATE_LIMIT tokens per second
+API_RATE_LIMIT = 100.0
+# The number of requests allowed in flight at once. Set to 1 to make requests one at a time like before
+API_MAX_WORKERS = 16
 
 # When making a request to the Wikimedia API they ask that you include a "unique ID" that will allow them to
 # contact you if something happens - such as - your code exceeding request limits - or some other error happens
@@ -21,15 +30,36 @@ REQUEST_HEADERS = {
     'User-Agent': 'shurygin@uw.edu, University of Washington, MSDS DATA 512 - AUTUMN 2022',
 }
 
-# This is just a list of English Wikipedia article titles for the dinosaurs we are looking at
-ARTICLE_TITLES = pd.read_csv("dinosaur_names_to_links_sept_2022.csv") ["name"]
+# This is just a list of English Wikipedia article titles for the dinosaurs we are looking at. Importing this file doesn't
+# read it, it is read by load_article_titles the first time the titles are needed (or ARTICLE_TITLES is used)
+ARTICLE_TITLES_PATH = "dinosaur_names_to_links_sept_2022.csv"
 # Start end end dates in YYYYMMDDSS format. API will search between these dates for pageview metrics
 START_DATE = "2015070100"
 END_DATE = "2022100100"
+# The period each data point covers, "monthly" or "daily". Daily data is requested a year at a time and can be turned into
+# weekly or monthly data locally with wikipedia_pageview_store.resample_matrix, so one daily run gives every coarser view
+GRANULARITY = "monthly"
 # output path for JSON data to be stored in once API is queried.
-MOBILE_DATA_PATH = "dino_monthly_mobile_"+ str(START_DATE[0:6]) + "-" + str(END_DATE[0:6]) +".json"
-DESKTOP_DATA_PATH = "dino_monthly_desktop_" + str(START_DATE[0:6]) + "-" + str(END_DATE[0:6]) + ".json"
-COMBINED_DATA_PATH = "dino_monthly_cumulative_"+str(START_DATE[0:6]) + "-" + str(END_DATE[0:6])+".json"
+MOBILE_DATA_PATH = "dino_" + GRANULARITY + "_mobile_"+ str(START_DATE[0:6]) + "-" + str(END_DATE[0:6]) +".json"
+DESKTOP_DATA_PATH = "dino_" + GRANULARITY + "_desktop_" + str(START_DATE[0:6]) + "-" + str(END_DATE[0:6]) + ".json"
+COMBINED_DATA_PATH = "dino_" + GRANULARITY + "_cumulative_"+str(START_DATE[0:6]) + "-" + str(END_DATE[0:6])+".json"
+# output path for the JSON Lines file written while the API is queried, one line per title holding all three outputs.
+# The JSON files above are converted from it once every title is done
+STREAM_DATA_PATH = "dino_" + GRANULARITY + "_"+str(START_DATE[0:6]) + "-" + str(END_DATE[0:6])+".jsonl"
+# base paths of the columnar stores the analysis stage loads, see wikipedia_pageview_store for the files each one is made of
+MOBILE_STORE_PATH = MOBILE_DATA_PATH[:-len(".json")]
+DESKTOP_STORE_PATH = DESKTOP_DATA_PATH[:-len(".json")]
+COMBINED_STORE_PATH = COMBINED_DATA_PATH[:-len(".json")]
+
+# The access types that have to be requested from the API to build each of the outputs above
+OUTPUT_ACCESS_TYPES = {
+    "mobile":     ["mobile-web", "mobile-app"],
+    "desktop":    ["desktop"],
+    "cumulative": ["all-access"],
+}
+# all-access is just desktop + mobile-web + mobile-app, so when we are already requesting those we can sum them
+# locally and skip one request per title. Off by default so the cumulative output matches the API's own totals
+DERIVE_ALL_ACCESS_LOCALLY = False
 
 # This template is used to map parameter values into the API_REQUST_PER_ARTICLE_PARAMS portion of an API request. The dictionary has a
 # field/key for each of the required parameters. In the example, below, we only vary the article name, so the majority of the fields
@@ -39,11 +69,27 @@ ARTICLE_PAGEVIEWS_PARAMS_TEMPLATE = {
     "access":      "",             # this value will be set/changed before each request
     "agent":       "user",
     "article":     "",             # this value will be set/changed before each request
-    "granularity": "monthly",
+    "granularity": GRANULARITY,
     "start":       "",             # this value will be set/changed before each request
     "end":         ""              # this value will be set/changed before each request
 }
 
+# Requests made one at a time through request_pageviews_per_article all share this limiter, so they are spaced out
+# just like requests made concurrently
+DEFAULT_RATE_LIMITER = TokenBucketRateLimiter(API_RATE_LIMIT)
+
+#reads the article titles from one column of a CSV file, by default the dinosaur list in ARTICLE_TITLES_PATH
+def load_article_titles(path = ARTICLE_TITLES_PATH, column = "name"):
+    with open(path, newline="", encoding="utf-8") as csv_file:
+        return [row[column] for row in csv.DictReader(csv_file)]
+
+#ARTICLE_TITLES used to be read when this file was imported, now it is read the first time it is asked for and kept
+def __getattr__(name):
+    if name == "ARTICLE_TITLES":
+        globals()["ARTICLE_TITLES"] = load_article_titles()
+        return globals()["ARTICLE_TITLES"]
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
+
 def request_pageviews_per_article(article_title = None, 
                                   endpoint_url = API_REQUEST_PAGEVIEWS_ENDPOINT, 
                                   endpoint_params = API_REQUEST_PER_ARTICLE_PARAMS, 
@@ -51,133 +97,477 @@ def request_pageviews_per_article(article_title = None,
                                   headers = REQUEST_HEADERS,
                                   access = "desktop",
                                   start = START_DATE,
-                                  end = END_DATE):
+                                  end = END_DATE,
+                                  rate_limiter = DEFAULT_RATE_LIMITER,
+                                  client = None,
+                                  telemetry = None):
     # Make sure we have an article title
     if not article_title: return None
     
-    # Titles are supposed to have spaces replaced with "_" and be URL encoded
-    article_title_encoded = urllib.parse.quote(article_title.replace(' ','_'))
-    request_template['article'] = article_title_encoded
-    request_template['access'] = access
-    request_template['start'] = start
-    request_template['end'] = end
-    
-    # now, create a request URL by combining the endpoint_url with the parameters for the request
-    request_url = endpoint_url+endpoint_params.format(**request_template)
-    
-    # make the request
-    try:
-        # we'll wait first, to make sure we don't exceed the limit in the situation where an exception
-        # occurs during the request processing - throttling is always a good practice with a free
-        # data source like Wikipedia - or other community sources
-        if API_THROTTLE_WAIT > 0.0:
-            time.sleep(API_THROTTLE_WAIT)
-        response = requests.get(request_url, headers=headers)
-        json_response = response.json()
-    except Exception as e:
-        print(e)
-        json_response = None
-    return json_response
+    # a client shared between calls keeps its connections open, without one we make a client just for this request
+    if client is None:
+        client = PageviewClient(endpoint_url, endpoint_params, request_template, headers, rate_limiter=rate_limiter, pool_size=1,
+                                telemetry=telemetry)
+        try:
+            return client.request_pageviews(article_title, access, start, end)
+        finally:
+            client.close()
+    return client.request_pageviews(article_title, access, start, end)
 
 """
-Queries the WIKIMEDIA API to find all page titles in the array titles between the start and end dates.
-Then queries the mobile user page view metrics for both mobile-web and mobile-app sources and combines them together.
-returns a JSON with each title in titles followed by a list of JSON objects, one for each month available to the API from start-end dates.
-May return an empty list if no data on the title could be found.
+Makes a PageviewClient for the per-article endpoint with its own rate limiter and a connection pool big enough for max_workers.
+@param: max_workers: the number of requests that will be in flight at once
+@param: rate_limit: the maximum number of requests sent per second across all workers
+@param: endpoint_url: the pageviews endpoint to query, can be pointed at a local server for testing
+@param: telemetry: an optional PageviewTelemetry, every request the client makes is recorded in it and the generate
+        and stream functions below report their progress to it
+"""
+def make_client(max_workers = API_MAX_WORKERS, rate_limit = API_RATE_LIMIT, endpoint_url = API_REQUEST_PAGEVIEWS_ENDPOINT, telemetry = None):
+    return PageviewClient(endpoint_url, API_REQUEST_PER_ARTICLE_PARAMS, ARTICLE_PAGEVIEWS_PARAMS_TEMPLATE, REQUEST_HEADERS,
+                          rate_limiter=TokenBucketRateLimiter(rate_limit), pool_size=max(1, max_workers), telemetry=telemetry)
+
+"""
+Queries the WIKIMEDIA API for every title in titles and every access type in accesses between the start and end dates.
+Requests are spread over max_workers threads which share a single token bucket, so no more than rate_limit requests
+are sent per second however many are in flight.
+returns a dictionary mapping each (title, access) pair to the JSON response for it, or None if the request failed.
 @param: titles: an array of string article titles
+@param: accesses: an array of access types to request for each title, e.g. ["mobile-web", "mobile-app"]
 @param: start a string of format YYYYMMDDSS for the start date of the search
 @param: end: a string of format YYYYMMDDSS for the end date of the search
+@param: max_workers: the number of requests allowed in flight at once
+@param: rate_limit: the maximum number of requests sent per second across all workers
+@param: endpoint_url: the pageviews endpoint to query, can be pointed at a local server for testing
+@param: cache: an optional PageviewCache, when given only the months it does not already hold are requested
+@param: client: an optional PageviewClient to send every request through, when given endpoint_url and rate_limit are
+        ignored and the client's own settings are used. Otherwise a client is made for this call and closed afterwards
+@param: granularity: "monthly" or "daily", daily data is requested in chunks, see PageviewClient.request_pageviews
+"""
+def request_pageviews_concurrently(titles, accesses, start = START_DATE, end = END_DATE,
+                                   max_workers = API_MAX_WORKERS,
+                                   rate_limit = API_RATE_LIMIT,
+                                   endpoint_url = API_REQUEST_PAGEVIEWS_ENDPOINT,
+                                   cache = None,
+                                   client = None,
+                                   granularity = GRANULARITY):
+    own_client = client is None
+    if own_client:
+        client = make_client(max_workers, rate_limit, endpoint_url)
+    keys = [(title, access) for title in titles for access in accesses]
+    request_fn = _title_access_request_fn(client, start, end, cache, granularity)
+    telemetry = client.telemetry
+    if telemetry is not None:
+        telemetry.start_progress(len(keys), "requests")
+        def request_fn(key, request_fn = request_fn):
+            response = request_fn(key)
+            telemetry.advance()
+            return response
+    try:
+        return fetch_concurrently(keys, request_fn, max_workers)
+    finally:
+        if own_client:
+            client.close()
+
+#returns a function that requests one (title, access) key through client, going through cache first if there is one
+def _title_access_request_fn(client, start, end, cache = None, granularity = GRANULARITY):
+    def request_fn(key):
+        title, access = key
+        def request_range(range_start, range_end):
+            return client.request_pageviews(title, access, range_start, range_end, granularity)
+        if cache is None:
+            return request_range(start, end)
+        cache_key = (client.request_template["project"], access, client.request_template["agent"],
+                     title.replace(' ','_'), granularity)
+        return cache.fetch(cache_key, start, end, request_range)
+    return request_fn
+
+"""
+Works out which access types need to be requested to build the given outputs.
+returns a list of access types with no repeats, in the order they are first needed.
+@param: outputs: an array of output names, each one a key of OUTPUT_ACCESS_TYPES
+@param: derive_all_access: if True the cumulative output is built from the desktop and mobile access types instead of all-access
+"""
+def access_types_for_outputs(outputs, derive_all_access = DERIVE_ALL_ACCESS_LOCALLY):
+    accesses = []
+    for output in outputs:
+        needed = OUTPUT_ACCESS_TYPES[output]
+        if output == "cumulative" and derive_all_access:
+            needed = OUTPUT_ACCESS_TYPES["desktop"] + OUTPUT_ACCESS_TYPES["mobile"]
+        for access in needed:
+            if access not in accesses:
+                accesses.append(access)
+    return accesses
+
+#returns the list of monthly items in an API response, or None if the request failed or the API had no data for the title.
+#the items are copied so that building one output never changes the responses another output is built from
+def _response_items(response):
+    if response is None or "items" not in response.keys():
+        return None
+    return [dict(month) for month in response["items"]]
+
+#returns True if any of responses, the API responses of one title, failed: the request was given up on or the API
+#answered with an error rather than data or "not found", e.g. a 400 or 403. The title can't be counted as done then
+def has_failed_response(responses):
+    return any(response is None or ("items" not in response and not is_not_found_response(response)) for response in responses)
+
+# How two series lined up when they were merged: the number of months in the merged series, and how many of those
+# months only the left or only the right series had
+MergeReport = namedtuple("MergeReport", ["months", "left_only", "right_only"])
+
 """
-def generate_mobile_monthly_pageviews(titles = ARTICLE_TITLES, start = START_DATE, end = END_DATE):
+Merges two lists of monthly items by timestamp, adding together the views of months both lists have and keeping
+months only one list has. Both lists must be sorted by timestamp, as the API returns them, and are walked once side
+by side, so this takes time proportional to their combined length.
+returns a (merged, report) tuple, merged being a new list of items sorted by timestamp and report a MergeReport.
+@param: left: a list of items, each with "timestamp" and "views"
+@param: right: a list of items, each with "timestamp" and "views"
+@param: access: if given every merged item has its "access" set to this, otherwise items keep their own
+"""
+def merge_series_by_timestamp(left, right, access = None):
+    merged = []
+    left_only = right_only = 0
+    left_ind = right_ind = 0
+    while left_ind < len(left) and right_ind < len(right):
+        left_month, right_month = left[left_ind], right[right_ind]
+        if left_month["timestamp"] == right_month["timestamp"]:
+            merged.append(dict(left_month, views=left_month["views"] + right_month["views"]))
+            left_ind += 1
+            right_ind += 1
+        elif left_month["timestamp"] < right_month["timestamp"]:
+            merged.append(dict(left_month))
+            left_only += 1
+            left_ind += 1
+        else:
+            merged.append(dict(right_month))
+            right_only += 1
+            right_ind += 1
+    #at most one of the lists has months left over, and none of them are in the other list
+    merged.extend(dict(month) for month in left[left_ind:])
+    merged.extend(dict(month) for month in right[right_ind:])
+    left_only += len(left) - left_ind
+    right_only += len(right) - right_ind
+    if access is not None:
+        for month in merged:
+            month["access"] = access
+    return merged, MergeReport(len(merged), left_only, right_only)
+
+#sums the views of several lists of monthly items month by month, returning one list of items labelled with access
+def _sum_items_by_timestamp(item_lists, access):
+    summed = []
+    for items in item_lists:
+        summed, _ = merge_series_by_timestamp(summed, items, access)
+    return summed
+
+"""
+Builds the mobile output from responses already fetched by request_pageviews_concurrently.
+Adds the mobile-web views of each title to its mobile-app views month by month, matching months by timestamp so the
+two series can start in different months or have gaps. A month either series has is kept. If the series did not
+line up, how many months only one of them had is printed, and recorded in merge_reports if it is given.
+returns a dictionary with each title in titles followed by a list of JSON objects, one for each month available.
+Will map a title to an empty dict if no data on the title could be found.
+@param: responses: a dictionary mapping (title, access) pairs to API responses, must contain mobile-web and mobile-app
+@param: titles: an array of string article titles
+@param: merge_reports: an optional dictionary, each title's MergeReport is stored in it (mobile-app on the left)
+"""
+def derive_mobile_pageviews(responses, titles, merge_reports = None):
     mobile_jsons = {}
     for title in titles:
-        mobile_web_json = request_pageviews_per_article(article_title=title, access="mobile-web", start=start, end=end)
-        mobile_app_json = request_pageviews_per_article(article_title=title, access="mobile-app", start=start, end=end)
-        if mobile_web_json is None or mobile_app_json is None:
+        mobile_web_response = responses[(title, "mobile-web")]
+        mobile_app_response = responses[(title, "mobile-app")]
+        #if either request failed we can't know the mobile total, but an access type the API has no data for just adds no views
+        if mobile_web_response is None or mobile_app_response is None:
             print(str(title) + " NOT FOUND BY THE API")
             mobile_jsons[title] = {}
             continue
-        if "items" not in mobile_web_json.keys() or "items" not in mobile_app_json.keys():
+        mobile_web_json = mobile_web_response.get("items", [])
+        mobile_app_json = mobile_app_response.get("items", [])
+        if not mobile_web_json and not mobile_app_json:
             print(str(title) + " NOT FOUND BY THE API")
             mobile_jsons[title] = {}
             continue
-        mobile_web_json = mobile_web_json["items"]
-        mobile_app_json = mobile_app_json["items"]
-        combined_json = mobile_app_json
-        for month_ind in range(len(mobile_web_json)):
-            month = mobile_web_json[month_ind]
-            views = month["views"]
-            combined_json[month_ind]["views"] += views #combining the views from the mobile-web access with the mobile-app access so we have sum of mobile views
+        #combining the views from the mobile-web access with the mobile-app access so we have sum of mobile views.
+        #items keep the mobile-app label like they always have
+        combined_json, report = merge_series_by_timestamp(mobile_app_json, mobile_web_json, "mobile-app")
+        if merge_reports is not None:
+            merge_reports[title] = report
+        if report.left_only or report.right_only:
+            print(str(title) + " MOBILE SERIES DID NOT LINE UP: " + str(report.right_only) + " months only in mobile-web, " +
+                  str(report.left_only) + " months only in mobile-app")
         mobile_jsons[title] = combined_json
-    return json.dumps(mobile_jsons, indent=4)
+    return mobile_jsons
 
 """
-Queries the WIKIMEDIA API to find all page titles in the array titles between the start and end dates.
-Then queries the mobile user page view metrics for ALL sources.
-returns a JSON with each title in titles followed by a list of JSON objects, one for each month available to the API from start-end dates.
-May return an empty list if no data on the title could be found.
+Builds the desktop output from responses already fetched by request_pageviews_concurrently.
+returns a dictionary with each title in titles followed by a list of JSON objects, one for each month available.
+Will map a title to an empty dict if no data on the title could be found.
+@param: responses: a dictionary mapping (title, access) pairs to API responses, must contain desktop
 @param: titles: an array of string article titles
-@param: start a string of format YYYYMMDDSS for the start date of the search
-@param: end: a string of format YYYYMMDDSS for the end date of the search
 """
-def generate_cumulative_monthly_pageviews(titles = ARTICLE_TITLES,  start = START_DATE, end = END_DATE):
+def derive_desktop_pageviews(responses, titles):
+    dekstop_jsons = {}
+    for title in titles:
+        desktop_json = _response_items(responses[(title, "desktop")])
+        if desktop_json is None:
+            print(str(title) + " NOT FOUND BY THE API")
+            dekstop_jsons[title] = {}
+            continue
+        dekstop_jsons[title] = desktop_json
+    return dekstop_jsons
+
+"""
+Builds the cumulative output from responses already fetched by request_pageviews_concurrently.
+Each month holds the running total of views up to and including that month.
+If derive_all_access is set the monthly views are the sum of the desktop, mobile-web and mobile-app responses,
+otherwise they are taken from the all-access response.
+returns a dictionary with each title in titles followed by a list of JSON objects, one for each month available.
+Will map a title to an empty dict if no data on the title could be found.
+@param: responses: a dictionary mapping (title, access) pairs to API responses
+@param: titles: an array of string article titles
+@param: derive_all_access: if True build the all-access views locally from the other access types
+"""
+def derive_cumulative_pageviews(responses, titles, derive_all_access = DERIVE_ALL_ACCESS_LOCALLY):
     combined_jsons = {}
     for title in titles:
-        combined_json = request_pageviews_per_article(article_title=title, access="all-access", start=start, end=end)
+        if derive_all_access:
+            title_responses = [responses[(title, access)] for access in OUTPUT_ACCESS_TYPES["desktop"] + OUTPUT_ACCESS_TYPES["mobile"]]
+            access_items = [_response_items(response) for response in title_responses]
+            #a failed request means we can't know the total, but an access type the API has no data for just adds no views
+            if any(response is None for response in title_responses):
+                combined_json = None
+            else:
+                combined_json = _sum_items_by_timestamp([items for items in access_items if items is not None], "all-access") or None
+        else:
+            combined_json = _response_items(responses[(title, "all-access")])
         if combined_json is None:
             print(str(title) + " NOT FOUND BY THE API")
-            combined_json[title] = {}
-            continue
-        if "items" not in combined_json.keys() :
-            print(str(title) + "NOT FOUND BY THE LOOKUP")
             combined_jsons[title] = {}
             continue
-        combined_json = combined_json["items"]
         running_sum_views = 0
         for month in combined_json:
             running_sum_views += month["views"]
             month["views"] = running_sum_views
         combined_jsons[title] = combined_json
-        
-    return json.dumps(combined_jsons, indent=4)
+    return combined_jsons
+
+"""
+Queries the WIKIMEDIA API once for every access type any of the outputs needs, in a single scheduled batch over all
+titles, then builds every requested output from that one set of responses.
+returns a dictionary mapping each output name to a dictionary of title to a list of monthly JSON objects.
+@param: titles: an array of string article titles, the dinosaur list from load_article_titles if None
+@param: outputs: an array of output names to build, any of "mobile", "desktop" and "cumulative"
+@param: start a string of format YYYYMMDDSS for the start date of the search
+@param: end: a string of format YYYYMMDDSS for the end date of the search
+@param: derive_all_access: if True build the cumulative output from desktop and mobile instead of requesting all-access
+@param: max_workers: the number of requests allowed in flight at once
+@param: rate_limit: the maximum number of requests sent per second across all workers
+@param: endpoint_url: the pageviews endpoint to query, can be pointed at a local server for testing
+@param: cache: an optional PageviewCache, when given only the months it does not already hold are requested
+@param: client: an optional PageviewClient to send every request through, see request_pageviews_concurrently
+@param: granularity: "monthly" or "daily", despite the name of this function
+"""
+def generate_monthly_pageviews(titles = None, outputs = ("mobile", "desktop", "cumulative"),
+                               start = START_DATE, end = END_DATE,
+                               derive_all_access = DERIVE_ALL_ACCESS_LOCALLY,
+                               max_workers = API_MAX_WORKERS, rate_limit = API_RATE_LIMIT,
+                               endpoint_url = API_REQUEST_PAGEVIEWS_ENDPOINT,
+                               cache = None, client = None, granularity = GRANULARITY):
+    titles = list(load_article_titles() if titles is None else titles)
+    accesses = access_types_for_outputs(outputs, derive_all_access)
+    responses = request_pageviews_concurrently(titles, accesses, start, end, max_workers, rate_limit, endpoint_url, cache, client, granularity)
+    return derive_outputs(responses, titles, outputs, derive_all_access)
+
+"""
+Builds every output in outputs from responses already fetched by request_pageviews_concurrently.
+returns a dictionary mapping each output name to a dictionary of title to a list of monthly JSON objects.
+@param: responses: a dictionary mapping (title, access) pairs to API responses
+@param: titles: an array of string article titles
+@param: outputs: an array of output names to build, any of "mobile", "desktop" and "cumulative"
+@param: derive_all_access: if True build the cumulative output from desktop and mobile instead of all-access
+"""
+def derive_outputs(responses, titles, outputs, derive_all_access = DERIVE_ALL_ACCESS_LOCALLY):
+    results = {}
+    for output in outputs:
+        if output == "mobile":
+            results[output] = derive_mobile_pageviews(responses, titles)
+        elif output == "desktop":
+            results[output] = derive_desktop_pageviews(responses, titles)
+        elif output == "cumulative":
+            results[output] = derive_cumulative_pageviews(responses, titles, derive_all_access)
+    return results
+
+"""
+Does the same as generate_monthly_pageviews, but instead of returning every output at the end it appends one JSON
+Lines record per title to output_path as soon as all of that title's requests are done, see wikipedia_pageview_writer.
+Only the titles whose requests are still in flight are held in memory. If resume is True the titles already in
+output_path are skipped, so a run that was interrupted carries on from where it stopped.
+returns the number of titles written by this call.
+@param: output_path: the path of the JSON Lines file to write
+@param: titles: an array of string article titles, the dinosaur list from load_article_titles if None
+@param: outputs: an array of output names to build, any of "mobile", "desktop" and "cumulative"
+@param: start a string of format YYYYMMDDSS for the start date of the search
+@param: end: a string of format YYYYMMDDSS for the end date of the search
+@param: derive_all_access: if True build the cumulative output from desktop and mobile instead of requesting all-access
+@param: max_workers: the number of requests allowed in flight at once
+@param: rate_limit: the maximum number of requests sent per second across all workers
+@param: endpoint_url: the pageviews endpoint to query, can be pointed at a local server for testing
+@param: cache: an optional PageviewCache, when given only the months it does not already hold are requested
+@param: client: an optional PageviewClient to send every request through, see request_pageviews_concurrently
+@param: resume: if False output_path is emptied first and every title is requested
+@param: granularity: "monthly" or "daily", despite the name of this function
+"""
+def stream_monthly_pageviews(output_path = STREAM_DATA_PATH, titles = None, outputs = ("mobile", "desktop", "cumulative"),
+                             start = START_DATE, end = END_DATE,
+                             derive_all_access = DERIVE_ALL_ACCESS_LOCALLY,
+                             max_workers = API_MAX_WORKERS, rate_limit = API_RATE_LIMIT,
+                             endpoint_url = API_REQUEST_PAGEVIEWS_ENDPOINT,
+                             cache = None, client = None, resume = True, granularity = GRANULARITY):
+    if resume:
+        done = completed_titles(output_path)
+    else:
+        open(output_path, "w").close()
+        done = set()
+    if titles is None:
+        titles = load_article_titles()
+    titles = [title for title in dict.fromkeys(titles) if title not in done]
+    accesses = access_types_for_outputs(outputs, derive_all_access)
+    keys = [(title, access) for title in titles for access in accesses]
+    own_client = client is None
+    if own_client:
+        client = make_client(max_workers, rate_limit, endpoint_url)
+    if client.telemetry is not None:
+        client.telemetry.start_progress(len(titles))
+    #responses of the titles that still have requests in flight
+    in_flight = {}
+    try:
+        with JsonLinesWriter(output_path) as writer:
+            for key, response in iter_concurrently(keys, _title_access_request_fn(client, start, end, cache, granularity), max_workers):
+                title = key[0]
+                title_responses = in_flight.setdefault(title, {})
+                title_responses[key] = response
+                if len(title_responses) == len(accesses):
+                    del in_flight[title]
+                    results = derive_outputs(title_responses, [title], outputs, derive_all_access)
+                    #a title with a failed request is written so the outputs still list it, but marked so a resumed run asks for it again
+                    writer.write(title, {output: results[output][title] for output in outputs},
+                                 failed=has_failed_response(title_responses.values()))
+                    if client.telemetry is not None:
+                        client.telemetry.advance()
+        if writer.records_failed:
+            print(str(writer.records_failed) + " titles had failed requests and will be requested again by the next run")
+        return writer.records_written
+    finally:
+        if own_client:
+            client.close()
+
+"""
+Queries the WIKIMEDIA API to find all page titles in the array titles between the start and end dates.
+Then queries the mobile user page view metrics for both mobile-web and mobile-app sources and combines them together.
+returns a JSON with each title in titles followed by a list of JSON objects, one for each month available to the API from start-end dates.
+May return an empty list if no data on the title could be found.
+@param: titles: an array of string article titles, the dinosaur list from load_article_titles if None
+@param: start a string of format YYYYMMDDSS for the start date of the search
+@param: end: a string of format YYYYMMDDSS for the end date of the search
+@param: max_workers: the number of requests allowed in flight at once
+@param: rate_limit: the maximum number of requests sent per second across all workers
+@param: endpoint_url: the pageviews endpoint to query, can be pointed at a local server for testing
+"""
+def generate_mobile_monthly_pageviews(titles = None, start = START_DATE, end = END_DATE,
+                                      max_workers = API_MAX_WORKERS, rate_limit = API_RATE_LIMIT,
+                                      endpoint_url = API_REQUEST_PAGEVIEWS_ENDPOINT):
+    results = generate_monthly_pageviews(titles, ["mobile"], start, end, False, max_workers, rate_limit, endpoint_url)
+    return json.dumps(results["mobile"], indent=4)
+
+"""
+Queries the WIKIMEDIA API to find all page titles in the array titles between the start and end dates.
+Then queries the mobile user page view metrics for ALL sources.
+returns a JSON with each title in titles followed by a list of JSON objects, one for each month available to the API from start-end dates.
+May return an empty list if no data on the title could be found.
+@param: titles: an array of string article titles, the dinosaur list from load_article_titles if None
+@param: start a string of format YYYYMMDDSS for the start date of the search
+@param: end: a string of format YYYYMMDDSS for the end date of the search
+@param: max_workers: the number of requests allowed in flight at once
+@param: rate_limit: the maximum number of requests sent per second across all workers
+@param: endpoint_url: the pageviews endpoint to query, can be pointed at a local server for testing
+"""
+def generate_cumulative_monthly_pageviews(titles = None, start = START_DATE, end = END_DATE,
+                                          max_workers = API_MAX_WORKERS, rate_limit = API_RATE_LIMIT,
+                                          endpoint_url = API_REQUEST_PAGEVIEWS_ENDPOINT):
+    results = generate_monthly_pageviews(titles, ["cumulative"], start, end, False, max_workers, rate_limit, endpoint_url)
+    return json.dumps(results["cumulative"], indent=4)
 
 """
 Queries the WIKIMEDIA API to find all page titles in the array titles between the start and end dates.
 Then queries the mobile user page view metrics for DESKTOP sources and combines them together.
 returns a JSON with each title in titles followed by a list of JSON objects, one for each month available to the API from start-end dates.
 May return an empty list if no data on the title could be found.
-@param: titles: an array of string article titles
+@param: titles: an array of string article titles, the dinosaur list from load_article_titles if None
 @param: start a string of format YYYYMMDDSS for the start date of the search
 @param: end: a string of format YYYYMMDDSS for the end date of the search
+@param: max_workers: the number of requests allowed in flight at once
+@param: rate_limit: the maximum number of requests sent per second across all workers
+@param: endpoint_url: the pageviews endpoint to query, can be pointed at a local server for testing
 """
-def generate_desktop_monthly_pageviews(titles = ARTICLE_TITLES,  start = START_DATE, end = END_DATE):
-    dekstop_jsons = {}
-    for title in titles:
-        desktop_json = request_pageviews_per_article(article_title=title, access="desktop", start=start, end=end)
-        if desktop_json is None:
-            print(str(title) + " NOT FOUND BY THE API")
-            desktop_json[title] = {}
-            continue
-        if "items" not in desktop_json.keys() :
-            print(str(title) + "NOT FOUND BY THE LOOKUP")
-            dekstop_jsons[title] = {}
-            continue
-        desktop_json = desktop_json["items"]
-        dekstop_jsons[title] = desktop_json
-        
-    return json.dumps(dekstop_jsons, indent=4)
+def generate_desktop_monthly_pageviews(titles = None, start = START_DATE, end = END_DATE,
+                                       max_workers = API_MAX_WORKERS, rate_limit = API_RATE_LIMIT,
+                                       endpoint_url = API_REQUEST_PAGEVIEWS_ENDPOINT):
+    results = generate_monthly_pageviews(titles, ["desktop"], start, end, False, max_workers, rate_limit, endpoint_url)
+    return json.dumps(results["desktop"], indent=4)
 
-if __name__ == "__main__":
+"""
+Runs the generator from the command line: streams every output for the titles to STREAM_DATA_PATH, then writes the
+JSON files and the columnar stores the analysis stage reads.
+@param: argv: the command line arguments, sys.argv[1:] if None
+"""
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Request the monthly pageviews of every title and write the mobile, desktop and cumulative outputs")
+    parser.add_argument("--titles-csv", default=ARTICLE_TITLES_PATH, help="CSV file with the article titles in its name column")
+    parser.add_argument("--max-workers", type=int, default=API_MAX_WORKERS)
+    parser.add_argument("--rate-limit", type=float, default=API_RATE_LIMIT)
+    parser.add_argument("--endpoint-url", default=API_REQUEST_PAGEVIEWS_ENDPOINT)
+    parser.add_argument("--cache", default=PAGEVIEW_CACHE_PATH, help="the response cache file, empty to not use one")
+    parser.add_argument("--no-resume", action="store_true", help="start the stream file again from scratch")
+    parser.add_argument("--metrics", default=TELEMETRY_METRICS_PATH, help="where to save the run's metrics as JSON, empty to not save them")
+    parser.add_argument("--prometheus", help="also save the run's metrics here in the Prometheus text format")
+    parser.add_argument("--aggregates", default=AGGREGATES_PATH, help="the aggregate index to add the new months to, empty to not keep one")
+    args = parser.parse_args(argv)
+    #numpy is only needed once the requests are done
+    from wikipedia_pageview_store import jsonl_to_store
     #KEY NOTE. THE API fails to find the webpages for Tuebingosaurus and Elemgasem. Thus they are given empty timeseries and will show up later in analysis!
-    print("Generating Monthly Pageviews of MOBILE users")
-    mobile_jsons = generate_mobile_monthly_pageviews()
-    jsonFile = open(MOBILE_DATA_PATH, "w")
-    jsonFile.write(mobile_jsons)
-    print("Generating Monthly Pageviews of DESKTOP users")
-    desktop_jsons = generate_desktop_monthly_pageviews()
-    jsonFile = open(DESKTOP_DATA_PATH, "w")
-    jsonFile.write(desktop_jsons)
-    print("Generating Monthly Pageviews of ALL users")
-    combined_jsons = generate_cumulative_monthly_pageviews()
-    jsonFile = open(COMBINED_DATA_PATH, "w")
-    jsonFile.write(combined_jsons)
+    #every access type is fetched in one pass over the titles and all three outputs are built from the same responses
+    #months already in the cache from an earlier run are not requested again, only the months after them
+    #each title is written to STREAM_DATA_PATH as soon as it is done, so running this again after a crash carries on where it stopped
+    print("Generating Monthly Pageviews of MOBILE, DESKTOP and ALL users")
+    titles = load_article_titles(args.titles_csv)
+    cache = PageviewCache(args.cache) if args.cache else None
+    telemetry = PageviewTelemetry()
+    client = make_client(args.max_workers, args.rate_limit, args.endpoint_url, telemetry)
+    try:
+        written = stream_monthly_pageviews(STREAM_DATA_PATH, titles, max_workers=args.max_workers, cache=cache, client=client,
+                                           resume=not args.no_resume)
+    finally:
+        client.close()
+        if cache is not None:
+            cache.close()
+        #the metrics are saved even if the run was interrupted, they show where it had got to
+        if args.metrics:
+            telemetry.write_json(args.metrics)
+        if args.prometheus:
+            telemetry.write_prometheus(args.prometheus)
+    print(str(written) + " titles written to " + STREAM_DATA_PATH)
+    if cache is not None:
+        print(cache.report())
+    print(client.report())
+    print(telemetry.report())
+    for output, path, store_path in [("mobile", MOBILE_DATA_PATH, MOBILE_STORE_PATH), ("desktop", DESKTOP_DATA_PATH, DESKTOP_STORE_PATH),
+                                     ("cumulative", COMBINED_DATA_PATH, COMBINED_STORE_PATH)]:
+        jsonl_to_legacy_json(STREAM_DATA_PATH, output, path, titles)
+        jsonl_to_store(STREAM_DATA_PATH, output, store_path, GRANULARITY, titles)
+    #the index counts months, so only monthly runs are added to it. Only the months after the ones already in it are added,
+    #and it is kept to the same titles in the same order as the outputs so the charts pick the same articles either way
+    if args.aggregates and GRANULARITY == "monthly":
+        aggregates = PageviewAggregates(args.aggregates)
+        print(str(aggregates.update_from_jsonl(STREAM_DATA_PATH, ["mobile", "desktop"], titles)) + " new or refreshed months added to " + args.aggregates)
+        aggregates.close()
+
+if __name__ == "__main__":
+    main()
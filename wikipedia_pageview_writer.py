@@ -0,0 +1,102 @@
+'''this file contains the streaming output writer used by wikipedia_pageview_timeseries_generator
+
+Rather than holding every title in memory and writing one large JSON document at the end, the generator writes one
+JSON Lines record per title as soon as all of that title's requests have come back. Each record holds every output
+for the title, e.g. {"title": ..., "mobile": [...], "desktop": [...], "cumulative": [...]}, so a title is either
+fully written or not written at all. The file is its own checkpoint: a run that is interrupted can be started again
+and will skip every title already in the file. A title with a request that failed even after retrying, or that the
+API answered with an error instead of data or "not found", is still written, with "failed": true, so the outputs list it, but it doesn't count as done and is requested again next time.
+If a title appears more than once the last record is the one that counts. jsonl_to_legacy_json turns the file back into the
+dino_monthly_*.json files that wikipedia_pageview_analysis.load_data reads.
+'''
+import json, os
+
+"""
+Reads the titles already written to a JSON Lines file. If the last line was only partly written when a run was
+interrupted it is cut off the end of the file so that new records can be appended cleanly.
+returns a set of the titles in the file whose last record is not marked failed, empty if the file does not exist.
+@param: path: the path of the JSON Lines file
+"""
+def completed_titles(path):
+    titles = set()
+    if not os.path.exists(path):
+        return titles
+    good_length = 0
+    with open(path, "rb") as jsonl_file:
+        for line in jsonl_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith(b"\n"):
+                break
+            if record.get("failed"):
+                titles.discard(record["title"])
+            else:
+                titles.add(record["title"])
+            good_length += len(line)
+    if good_length != os.path.getsize(path):
+        with open(path, "r+b") as jsonl_file:
+            jsonl_file.truncate(good_length)
+    return titles
+
+"""
+Appends one record per title to a JSON Lines file, flushing each record to disk as it is written.
+Use it as a context manager so the file is always closed.
+@param: path: the path of the JSON Lines file, appended to if it already exists
+@param: sync: if True each record is also fsynced, so it survives the machine going down and not just the process
+"""
+class JsonLinesWriter:
+    def __init__(self, path, sync = False):
+        self.path = path
+        self.sync = sync
+        self.records_written = 0
+        self.records_failed = 0
+        self._file = open(path, "a", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    #writes the record for one title, record is a dictionary of output name to that output's list of monthly items.
+    #failed marks a title that is missing data because a request failed, so a resumed run requests it again
+    def write(self, title, record, failed = False):
+        record = dict(record, title=title)
+        if failed:
+            record["failed"] = True
+            self.records_failed += 1
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+        self.records_written += 1
+
+#yields (title, record) for every record in a JSON Lines file written by JsonLinesWriter, in the order they were written
+def read_records(path):
+    with open(path, encoding="utf-8") as jsonl_file:
+        for line in jsonl_file:
+            record = json.loads(line)
+            record.pop("failed", None)
+            yield record.pop("title"), record
+
+"""
+Writes one output from a JSON Lines file in the same format the generator used to write, a JSON object mapping
+each title to its list of monthly items, indented by 4. If a title appears more than once the last record wins.
+@param: jsonl_path: the path of the JSON Lines file
+@param: output: the output to extract, e.g. "mobile"
+@param: json_path: the path to write the JSON file to
+@param: titles: an optional array of titles giving the order to write them in, titles not in the file are left out
+"""
+def jsonl_to_legacy_json(jsonl_path, output, json_path, titles = None):
+    series = {}
+    for title, record in read_records(jsonl_path):
+        series[title] = record[output]
+    if titles is not None:
+        series = {title: series[title] for title in titles if title in series}
+    with open(json_path, "w") as json_file:
+        json_file.write(json.dumps(series, indent=4))